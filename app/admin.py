@@ -6,7 +6,4 @@ admin.site.register(Question)
 admin.site.register(Answer)
 admin.site.register(Tag)
 admin.site.register(Profile)
-admin.site.register(LikeQuestion)
-admin.site.register(LikeAnswer)
-admin.site.register(DislikeQuestion)
-admin.site.register(DislikeAnswer)
+admin.site.register(Reaction)
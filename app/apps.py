@@ -1,6 +1,28 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from app import cards, metrics, nplusone, reactions
+        from app.models import Question, Answer, Profile
+        from app.search import ensure_fulltext_index
+        from app.search_cache import bump_generation
+        from app.search_index import question_deleted, question_saved
+
+        connection_created.connect(metrics.install_query_wrapper)
+        connection_created.connect(nplusone.install_query_wrapper)
+        post_migrate.connect(ensure_fulltext_index, sender=self)
+        post_save.connect(question_saved, sender=Question)
+        post_delete.connect(question_deleted, sender=Question)
+        post_delete.connect(reactions.target_deleted, sender=Question)
+        post_delete.connect(reactions.target_deleted, sender=Answer)
+        post_save.connect(bump_generation, sender=Question)
+        post_delete.connect(bump_generation, sender=Question)
+        post_save.connect(cards.question_saved, sender=Question)
+        post_save.connect(cards.profile_saved, sender=Profile)
+        m2m_changed.connect(cards.question_tags_changed, sender=Question.tags.through)
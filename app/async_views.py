@@ -0,0 +1,108 @@
+"""
+ASGI entry points for the read-heavy pages.
+
+ETags, pagination, cards and reaction state are loaded with the async ORM and
+cache APIs, and new answers are published to Centrifugo with an async HTTP
+client. Template rendering, the answer form save and search ranking stay in
+the thread pool: they are CPU-bound or run sync-only code (template tags,
+transactions).
+"""
+import os
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from app import centrifugo, etags, page_cache, search_cache, views
+from app.cards import aattach_cards
+from app.models import Answer, Question, Tag
+from app.pagination import akeyset_paginate
+from app.reactions import areaction_state
+from users.forms import AnswerForm
+
+
+async def conditional(request, etag_func, page, *args, **kwargs):
+    request.user = await request.auser()
+    etag = await etag_func(request, *args, **kwargs)
+    etag = quote_etag(etag) if etag is not None else None
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await page()
+    if etag is not None and request.method in ('GET', 'HEAD'):
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+async def paginate_questions(questions, request):
+    if os.getenv('PAGINATE_MODE', 'keyset') != 'keyset':
+        return await sync_to_async(views.paginate_questions)(questions, request, keyset=True)
+    page_obj = await akeyset_paginate(Question.question_manager.listing(questions), request)
+    page_obj.object_list = await aattach_cards(page_obj.object_list)
+    return page_obj
+
+
+async def listing_page(request, template, title, questions, **extra):
+    page_obj = await paginate_questions(questions, request)
+    reactions = await areaction_state(request.user, question_ids=[q.id for q in page_obj])
+    context = views.listing_context(title, page_obj, questions, reactions, **extra)
+    response = await sync_to_async(render)(request, template, context=context)
+    keys = views.listing_keys(page_obj)
+    await etags.aremember_listing(request, keys)
+    return page_cache.add_surrogate_keys(response, keys)
+
+
+async def index(request):
+    async def page():
+        return await listing_page(request, 'index.html', "Main page", Question.question_manager.new_questions())
+
+    return await conditional(request, etags.alisting_etag, page)
+
+
+async def hot(request):
+    async def page():
+        questions = Question.question_manager.best_questions()
+        return await listing_page(request, 'tag.html', "Popular", questions, tag_name="Popular")
+
+    return await conditional(request, etags.alisting_etag, page)
+
+
+async def tag(request, tag_id):
+    async def page():
+        tag = await aget_object_or_404(Tag, pk=tag_id)
+        questions = Question.question_manager.tagged_questions(tag)
+        return await listing_page(request, 'tag.html', "Search by tag", questions, tag_name=tag.title)
+
+    return await conditional(request, etags.alisting_etag, page, tag_id=tag_id)
+
+
+async def question_page(request, question, form):
+    comments = [comment async for comment in Answer.answer_manager.best_answers(question_id=question.id)]
+    reactions = await areaction_state(request.user, question_ids=[question.id], answer_ids=[c.id for c in comments])
+    context = views.question_context(request, question, form, comments, reactions)
+    response = await sync_to_async(render)(request, 'question.html', context=context)
+    return page_cache.add_surrogate_keys(response, [f"question:{question.id}"])
+
+
+async def question(request, question_id):
+    if request.method == "POST":
+        request.user = await request.auser()
+        question = await aget_object_or_404(Question, pk=question_id)
+        form, new_answer = await sync_to_async(views.create_answer)(request, question)
+        if new_answer is not None:
+            await centrifugo.apublish(f"{question_id}", await sync_to_async(views.answer_payload)(new_answer))
+            return redirect(question.get_absolute_url() + f"#comment-{new_answer.pk}")
+        return await question_page(request, question, form)
+
+    async def page():
+        question = await aget_object_or_404(Question, pk=question_id)
+        return await question_page(request, question, AnswerForm())
+
+    return await conditional(request, etags.aquestion_etag, page, question_id=question_id)
+
+
+async def search_questions(request):
+    query = request.GET.get('q', '').strip()
+    if not query or len(query) < 2:
+        return JsonResponse({'results': []})
+
+    return JsonResponse({'results': await sync_to_async(search_cache.suggestions)(query)})
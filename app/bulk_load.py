@@ -0,0 +1,96 @@
+import datetime
+import os
+import tempfile
+from django.db import DatabaseError, connection
+
+
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+def load_data_enabled():
+    return connection.vendor == 'mysql' and os.getenv('FILL_DB_LOAD_DATA', 'true').lower() in ('true', '1', 't')
+
+
+def adapt(value):
+    if isinstance(value, datetime.datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    return value
+
+
+def encode(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(adapt(value)).translate(ESCAPES)
+
+
+class BulkWriter:
+    def __init__(self, batch_size, load_data=None):
+        self.batch_size = batch_size
+        self.load_data = load_data_enabled() if load_data is None else load_data
+        self.rows = 0
+        if self.load_data:
+            options = connection.settings_dict.setdefault('OPTIONS', {})
+            if not options.get('local_infile'):
+                connection.close()
+                options['local_infile'] = 1
+
+    @property
+    def method(self):
+        return 'LOAD DATA LOCAL INFILE' if self.load_data else 'multi-row INSERT'
+
+    def columns(self, model, fields):
+        return model._meta.db_table, [model._meta.get_field(field).column for field in fields]
+
+    def write(self, model, fields, rows):
+        if not rows:
+            return
+        table, columns = self.columns(model, fields)
+        if self.load_data:
+            try:
+                self.load(table, columns, rows)
+                self.rows += len(rows)
+                return
+            except DatabaseError:
+                self.load_data = False
+        self.insert(table, columns, rows)
+        self.rows += len(rows)
+
+    def insert(self, table, columns, rows):
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(table)} ({', '.join(qn(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, [tuple(adapt(value) for value in row) for row in rows[start:start + self.batch_size]])
+
+    def load(self, table, columns, rows):
+        qn = connection.ops.quote_name
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as f:
+            for row in rows:
+                f.write('\t'.join(encode(value) for value in row))
+                f.write('\n')
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {qn(table)} CHARACTER SET utf8mb4 "
+                    f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+                    f"({', '.join(qn(column) for column in columns)})",
+                    [f.name]
+                )
+        finally:
+            os.unlink(f.name)
+
+    def update(self, model, field, values):
+        if not values:
+            return
+        qn = connection.ops.quote_name
+        table, (column, pk) = self.columns(model, [field, 'id'])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {qn(table)} SET {qn(column)} = %s WHERE {qn(pk)} = %s",
+                [(value, object_id) for object_id, value in values]
+            )
@@ -0,0 +1,83 @@
+import os
+from django.core.cache import cache
+from django.db.models import F, aprefetch_related_objects, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from app import page_cache
+from app.models import Answer, Question
+
+
+CARD_TEMPLATE = 'layouts/question.html'
+CARD_VERSION = 1
+
+
+def card_key(question):
+    return f"card:{CARD_VERSION}:{question.id}:{question.version}"
+
+
+def card_ttl():
+    return int(os.getenv('CARD_CACHE_TTL', '86400'))
+
+
+def render_cards(questions, keys):
+    return {keys[question.id]: render_to_string(CARD_TEMPLATE, {'question': question}) for question in questions}
+
+
+def set_cards(questions, keys, cards):
+    for question in questions:
+        question.card = mark_safe(cards[keys[question.id]])
+    return questions
+
+
+def attach_cards(questions):
+    questions = list(questions)
+    keys = {question.id: card_key(question) for question in questions}
+    cards = cache.get_many(list(keys.values()))
+
+    missing = [question for question in questions if keys[question.id] not in cards]
+    if missing:
+        prefetch_related_objects(missing, 'tags')
+        rendered = render_cards(missing, keys)
+        cache.set_many(rendered, card_ttl())
+        cards.update(rendered)
+    return set_cards(questions, keys, cards)
+
+
+async def aattach_cards(questions):
+    keys = {question.id: card_key(question) for question in questions}
+    cards = await cache.aget_many(list(keys.values()))
+
+    missing = [question for question in questions if keys[question.id] not in cards]
+    if missing:
+        await aprefetch_related_objects(missing, 'tags')
+        rendered = render_cards(missing, keys)
+        await cache.aset_many(rendered, card_ttl())
+        cards.update(rendered)
+    return set_cards(questions, keys, cards)
+
+
+def bump_versions(**filters):
+    question_ids = list(Question.objects.filter(**filters).values_list('pk', flat=True))
+    Question.objects.filter(pk__in=question_ids).update(version=F('version') + 1)
+    page_cache.purge_questions(*question_ids)
+
+
+def question_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(pk=instance.pk)
+
+
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        bump_versions(tags=instance)
+    elif action in ('post_add', 'post_remove'):
+        bump_versions(**({'pk__in': pk_set} if reverse else {'pk': instance.pk}))
+    elif action == 'post_clear' and not reverse:
+        bump_versions(pk=instance.pk)
+
+
+def profile_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(user_id=instance.user_id)
+        answered = Answer.objects.filter(user_id=instance.user_id).values_list('question_id', flat=True).distinct()
+        page_cache.purge_questions(*answered)
@@ -0,0 +1,314 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+
+def batch_url(publish_url):
+    if publish_url and publish_url.rstrip('/').endswith('/publish'):
+        return publish_url.rstrip('/')[:-len('publish')] + 'batch'
+    return publish_url
+
+
+class Publisher:
+    def __init__(self, url, api_key, max_queue=1000, batch_size=100, flush_interval=0.05, timeout=2.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.headers.update({'X-API-Key': f'{api_key}', 'Content-type': 'application/json'})
+        self.stats_lock = threading.Lock()
+        self.counters = {'queued': 0, 'published': 0, 'failed': 0, 'dropped': 0, 'batches': 0, 'coalesced': 0}
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self.stats_lock:
+            return dict(self.counters, pending=self.queue.qsize())
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='centrifugo-publisher', daemon=True)
+                self.thread.start()
+
+    def publish(self, channel, data):
+        self.start()
+        try:
+            self.queue.put_nowait({'publish': {'channel': channel, 'data': data}})
+        except queue.Full:
+            self.count('dropped')
+            logger.warning("Centrifugo queue is full, dropping publication to channel %s", channel)
+            return False
+        self.count('queued')
+        return True
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            command = self.queue.get()
+            if command is STOP:
+                self.queue.task_done()
+                break
+            batch = [command]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    command = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if command is STOP:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(command)
+            self.send(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def send(self, commands):
+        try:
+            response = self.session.post(self.url, data=json.dumps({'commands': commands}), timeout=self.timeout)
+            response.raise_for_status()
+            replies = response.json().get('replies', []) if response.content else []
+        except (requests.RequestException, ValueError) as e:
+            self.count('failed', len(commands))
+            logger.warning("Centrifugo batch of %s publications failed: %s", len(commands), e)
+            return False
+        failed = sum(1 for reply in replies if reply.get('error'))
+        if failed:
+            logger.warning("Centrifugo rejected %s of %s publications", failed, len(commands))
+        self.count('failed', failed)
+        self.count('published', len(commands) - failed)
+        self.count('batches')
+        return not failed
+
+    def flush(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self.queue.unfinished_tasks
+
+    def close(self, timeout=5.0):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        self.session.close()
+
+
+class AsyncPublisher:
+    def __init__(self, url, api_key, max_queue=1000, batch_size=100, flush_interval=0.05, timeout=2.0):
+        self.url = url
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.counters = {'queued': 0, 'published': 0, 'failed': 0, 'dropped': 0, 'batches': 0}
+        self.task = None
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def stats(self):
+        return dict(self.counters, pending=self.queue.qsize())
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def publish(self, channel, data):
+        self.start()
+        try:
+            self.queue.put_nowait({'publish': {'channel': channel, 'data': data}})
+        except asyncio.QueueFull:
+            self.count('dropped')
+            logger.warning("Centrifugo queue is full, dropping publication to channel %s", channel)
+            return False
+        self.count('queued')
+        return True
+
+    async def run(self):
+        headers = {'X-API-Key': f'{self.api_key}', 'Content-type': 'application/json'}
+        async with httpx.AsyncClient(headers=headers, timeout=self.timeout) as client:
+            while True:
+                batch = [await self.queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                await self.send(client, batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def send(self, client, commands):
+        try:
+            response = await client.post(self.url, content=json.dumps({'commands': commands}))
+            response.raise_for_status()
+            replies = response.json().get('replies', []) if response.content else []
+        except (httpx.HTTPError, ValueError) as e:
+            self.count('failed', len(commands))
+            logger.warning("Centrifugo batch of %s publications failed: %s", len(commands), e)
+            return False
+        failed = sum(1 for reply in replies if reply.get('error'))
+        if failed:
+            logger.warning("Centrifugo rejected %s of %s publications", failed, len(commands))
+        self.count('failed', failed)
+        self.count('published', len(commands) - failed)
+        self.count('batches')
+        return not failed
+
+    async def flush(self, timeout=5.0):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+class Coalescer:
+    def __init__(self, publisher, interval=0.5):
+        self.publisher = publisher
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.due = {}
+        self.sent_at = {}
+        self.thread = None
+
+    def publish(self, channel, key, data):
+        now = time.monotonic()
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='centrifugo-coalescer', daemon=True)
+                self.thread.start()
+            if key in self.pending:
+                self.publisher.count('coalesced')
+            else:
+                self.due[key] = max(now, self.sent_at.get(key, 0) + self.interval)
+            self.pending[key] = (channel, data)
+            self.condition.notify()
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                ready = [key for key, due in self.due.items() if due <= now]
+                if not ready:
+                    self.condition.wait(min(self.due.values()) - now if self.due else None)
+                    continue
+                publications = []
+                for key in ready:
+                    del self.due[key]
+                    publications.append(self.pending.pop(key))
+                    self.sent_at[key] = now
+                self.sent_at = {key: sent for key, sent in self.sent_at.items() if now - sent < self.interval}
+            for channel, data in publications:
+                self.publisher.publish(channel, data)
+
+
+_publisher = None
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+_coalescer = None
+_async_publishers = {}
+
+
+def publisher_options():
+    return dict(
+        url=os.getenv('CENTRIFUGO_API_BATCH_URL') or batch_url(settings.CENTRIFUGO_WS_URL_PUBLISH_DATA),
+        api_key=settings.CENTRIFUGO_API_KEY,
+        max_queue=int(os.getenv('CENTRIFUGO_QUEUE_SIZE', '1000')),
+        batch_size=int(os.getenv('CENTRIFUGO_BATCH_SIZE', '100')),
+        flush_interval=float(os.getenv('CENTRIFUGO_FLUSH_INTERVAL', '0.05')),
+        timeout=float(os.getenv('CENTRIFUGO_TIMEOUT', '2')),
+    )
+
+
+def get_publisher():
+    global _publisher, _publisher_pid
+    with _publisher_lock:
+        if _publisher is None or _publisher_pid != os.getpid():
+            _publisher = Publisher(**publisher_options())
+            _publisher_pid = os.getpid()
+            atexit.register(_publisher.close)
+        return _publisher
+
+
+def get_async_publisher():
+    loop = asyncio.get_running_loop()
+    publisher = _async_publishers.get(loop)
+    if publisher is None:
+        for closed in [other for other in _async_publishers if other.is_closed()]:
+            del _async_publishers[closed]
+        publisher = _async_publishers[loop] = AsyncPublisher(**publisher_options())
+    return publisher
+
+
+def get_coalescer():
+    global _coalescer
+    publisher = get_publisher()
+    with _publisher_lock:
+        if _coalescer is None or _coalescer.publisher is not publisher:
+            _coalescer = Coalescer(publisher, interval=int(os.getenv('CENTRIFUGO_COALESCE_MS', '500')) / 1000)
+        return _coalescer
+
+
+def publish(channel, data):
+    if not settings.CENTRIFUGO_ENABLED or not settings.CENTRIFUGO_WS_URL_PUBLISH_DATA:
+        return False
+    return get_publisher().publish(channel, data)
+
+
+def publish_coalesced(channel, key, data):
+    if not settings.CENTRIFUGO_ENABLED or not settings.CENTRIFUGO_WS_URL_PUBLISH_DATA:
+        return False
+    return get_coalescer().publish(channel, key, data)
+
+
+async def apublish(channel, data):
+    if not settings.CENTRIFUGO_ENABLED or not settings.CENTRIFUGO_WS_URL_PUBLISH_DATA:
+        return False
+    return await get_async_publisher().publish(channel, data)
+
+
+async def apublish_coalesced(channel, key, data):
+    return publish_coalesced(channel, key, data)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import time
+from django.core.cache import cache
+from django.db.models import Max
+from app import page_cache
+from app.models import Question
+
+
+def conditional(request):
+    return request.method in ('GET', 'HEAD')
+
+
+def reactions_key(user_id):
+    return f"reactions:{user_id}"
+
+
+def time_bucket():
+    return int(time.time()) // int(os.getenv('ETAG_MAX_AGE', '300'))
+
+
+def digest(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def viewer_keys(request):
+    if request.user.is_authenticated:
+        return [reactions_key(request.user.id)]
+    return []
+
+
+def viewer_part(request, versions):
+    if request.user.is_authenticated:
+        return f"{request.user.id}.{versions[reactions_key(request.user.id)]}"
+    return 'anonymous'
+
+
+def listing_keys_key(request):
+    return f"{page_cache.page_key(request)}:keys"
+
+
+def remember_listing(request, keys):
+    cache.set(listing_keys_key(request), keys, int(os.getenv('ETAG_MAX_AGE', '300')))
+
+
+async def aremember_listing(request, keys):
+    await cache.aset(listing_keys_key(request), keys, int(os.getenv('ETAG_MAX_AGE', '300')))
+
+
+def listing_digest(request, keys, versions):
+    return digest(
+        request.get_full_path(), *(versions[key] for key in keys), viewer_part(request, versions), time_bucket()
+    )
+
+
+def listing_etag(request, *args, **kwargs):
+    if not conditional(request):
+        return None
+    keys = cache.get(listing_keys_key(request))
+    if keys is None:
+        return None
+    return listing_digest(request, keys, page_cache.current_versions([*keys, *viewer_keys(request)]))
+
+
+async def alisting_etag(request, *args, **kwargs):
+    if not conditional(request):
+        return None
+    keys = await cache.aget(listing_keys_key(request))
+    if keys is None:
+        return None
+    return listing_digest(request, keys, await page_cache.acurrent_versions([*keys, *viewer_keys(request)]))
+
+
+def question_state_queryset(question_id):
+    return Question.objects.filter(pk=question_id).annotate(
+        last_answer=Max('answer__time_update')
+    ).values_list('time_update', 'version', 'last_answer')
+
+
+def question_state(request, question_id):
+    if not hasattr(request, '_question_state'):
+        request._question_state = question_state_queryset(question_id).first()
+    return request._question_state
+
+
+def question_digest(request, question_id, state, versions):
+    time_update, version, last_answer = state
+    return digest(
+        question_id, time_update.timestamp(), version, last_answer and last_answer.timestamp(),
+        versions[f"question:{question_id}"], viewer_part(request, versions), time_bucket()
+    )
+
+
+def question_etag(request, question_id):
+    if not conditional(request):
+        return None
+    state = question_state(request, question_id)
+    if state is None:
+        return None
+    versions = page_cache.current_versions([f"question:{question_id}", *viewer_keys(request)])
+    return question_digest(request, question_id, state, versions)
+
+
+async def aquestion_etag(request, question_id):
+    if not conditional(request):
+        return None
+    state = await question_state_queryset(question_id).afirst()
+    if state is None:
+        return None
+    versions = await page_cache.acurrent_versions([f"question:{question_id}", *viewer_keys(request)])
+    return question_digest(request, question_id, state, versions)
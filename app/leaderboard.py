@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from django.core.cache import cache
+from app.models import Tag, Profile
+
+
+POPULAR_TAGS_KEY = 'popular_tags'
+TOP_USERS_KEY = 'top_users'
+SNAPSHOT_VERSION = 1
+
+_local = {}
+_rebuilding = {POPULAR_TAGS_KEY: threading.Lock(), TOP_USERS_KEY: threading.Lock()}
+
+
+def popular_tags_size():
+    return int(os.getenv('POPULAR_TAGS_SIZE', '20'))
+
+
+def top_users_size():
+    return int(os.getenv('TOP_USERS_SIZE', '10'))
+
+
+def capacity(size):
+    return size * int(os.getenv('LEADERBOARD_SLACK', '2'))
+
+
+def popular_tags_ttl():
+    return int(os.getenv('POPULAR_TAGS_CACHE_TTL', '2678400'))
+
+
+def top_users_ttl():
+    return int(os.getenv('TOP_USERS_CACHE_TTL', '604800'))
+
+
+def load_popular_tags(limit):
+    return [tuple(row) for row in Tag.objects.order_by('-questions_count', 'id').values_list('id', 'title', 'questions_count')[:limit]]
+
+
+def load_top_users(limit):
+    return [tuple(row) for row in Profile.objects.order_by('-rating', 'id').values_list('id', 'name', 'rating')[:limit]]
+
+
+def snapshot(entries):
+    return {'version': SNAPSHOT_VERSION, 'items': [tuple(entry) for entry in entries]}
+
+
+def entries_of(value):
+    if isinstance(value, dict) and value.get('version') == SNAPSHOT_VERSION:
+        return value['items']
+    return None
+
+
+def store(key, entries, ttl):
+    value = snapshot(entries)
+    cache.set(key, value, ttl)
+    remember(key, value)
+    return value['items']
+
+
+def remember(key, value):
+    _local[key] = (time.monotonic() + float(os.getenv('SIDEBAR_L1_TTL', '5')), value)
+
+
+def rebuild_popular_tags():
+    return store(POPULAR_TAGS_KEY, load_popular_tags(capacity(popular_tags_size())), popular_tags_ttl())
+
+
+def rebuild_top_users():
+    return store(TOP_USERS_KEY, load_top_users(capacity(top_users_size())), top_users_ttl())
+
+
+def fresh(key):
+    local = _local.get(key)
+    if local is not None and local[0] > time.monotonic():
+        return local[1]['items']
+    return None
+
+
+def cached(key, rebuild):
+    entries = fresh(key)
+    if entries is not None:
+        return entries
+    value = cache.get(key)
+    entries = entries_of(value)
+    if entries is not None:
+        remember(key, value)
+        return entries
+    with _rebuilding[key]:
+        entries = fresh(key)
+        if entries is not None:
+            return entries
+        return rebuild_once(key, rebuild)
+
+
+def rebuild_once(key, rebuild):
+    lock_key = f"{key}:rebuild"
+    if cache.add(lock_key, 1, int(os.getenv('SIDEBAR_REBUILD_LOCK_TTL', '10'))):
+        try:
+            return rebuild()
+        finally:
+            cache.delete(lock_key)
+
+    stale = _local.get(key)
+    if stale is not None:
+        return stale[1]['items']
+    deadline = time.monotonic() + float(os.getenv('SIDEBAR_REBUILD_WAIT', '1'))
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        value = cache.get(key)
+        entries = entries_of(value)
+        if entries is not None:
+            remember(key, value)
+            return entries
+    return rebuild()
+
+
+def merge(entries, changed, limit):
+    changed = {entry[0]: entry for entry in changed}
+    complete = len(entries) < limit
+    entries = [changed.pop(entry[0], entry) for entry in entries]
+    if complete:
+        entries.extend(changed.values())
+    else:
+        lowest = min(entry[2] or 0 for entry in entries)
+        entries.extend(entry for entry in changed.values() if (entry[2] or 0) > lowest)
+    entries.sort(key=lambda entry: (-(entry[2] or 0), entry[0]))
+    return entries[:limit]
+
+
+def locked_update(key, changed, limit, ttl):
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + float(os.getenv('LEADERBOARD_LOCK_WAIT', '0.05'))
+    while not cache.add(lock_key, 1, 5):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    try:
+        entries = entries_of(cache.get(key))
+        if entries is None:
+            return False
+        store(key, merge(entries, changed, limit), ttl)
+        return True
+    finally:
+        cache.delete(lock_key)
+
+
+def tags_changed(tag_ids):
+    changed = Tag.objects.filter(pk__in=tag_ids).values_list('id', 'title', 'questions_count')
+    return locked_update(POPULAR_TAGS_KEY, [tuple(row) for row in changed], capacity(popular_tags_size()), popular_tags_ttl())
+
+
+def profile_changed(profile):
+    entry = (profile.id, profile.name, profile.rating)
+    return locked_update(TOP_USERS_KEY, [entry], capacity(top_users_size()), top_users_ttl())
+
+
+def popular_tags():
+    return cached(POPULAR_TAGS_KEY, rebuild_popular_tags)
+
+
+def top_users():
+    return cached(TOP_USERS_KEY, rebuild_top_users)
@@ -0,0 +1,263 @@
+import json
+import os
+import random
+import secrets
+import statistics
+import subprocess
+import threading
+import time
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from app.management.commands.bench_server import start_server, stop_server
+from app.models import Question, Answer, Tag
+
+
+BENCH_DIR = settings.BASE_DIR / 'bench'
+
+
+def percentile(timings, share):
+    return timings[max(0, int(len(timings) * share + 0.5) - 1)] if timings else 0
+
+
+def fill(template, values):
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    return template.format(**values)
+
+
+class Command(BaseCommand):
+    help = 'Replay a weighted traffic mix against the app and compare throughput, latency and queries with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+        parser.add_argument('--traffic', default=str(BENCH_DIR / 'traffic.jsonl'))
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=20, help='Logged-in users used by the auth entries')
+        parser.add_argument('--fill', type=int, metavar='RATIO', help='Seed an empty DB with fill_db at this ratio first')
+        parser.add_argument('--flush', action='store_true', help='Flush the DB before --fill')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads in gunicorn mode')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=2)
+        parser.add_argument('--no-page-cache', action='store_true')
+        parser.add_argument('--baseline', help='Baseline name, defaults to the mode')
+        parser.add_argument('--save', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Relative p95/throughput change reported as a regression')
+        parser.add_argument('--check', action='store_true', help='Exit with an error when a regression is found')
+
+    def seed(self, options):
+        if options['flush']:
+            call_command('flush', interactive=False, verbosity=0)
+        elif Question.objects.exists():
+            raise CommandError('The database already has questions, pass --flush to reseed it')
+        call_command('fill_db', str(options['fill']), seed=options['seed'], restart=True, stdout=open(os.devnull, 'w'))
+
+    def sample_ids(self, model, rng, count):
+        max_id = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        if not max_id:
+            return []
+        candidates = {rng.randint(1, max_id) for _ in range(count * 2)}
+        return sorted(model.objects.filter(id__in=candidates).values_list('id', flat=True)[:count])
+
+    def values(self, rng):
+        question_ids = self.sample_ids(Question, rng, 300)
+        if not question_ids:
+            raise CommandError('No questions found, run fill_db first or pass --fill')
+        answer_ids = self.sample_ids(Answer, rng, 300) or [0]
+        tag_ids = list(Tag.objects.order_by('-questions_count', 'id').values_list('id', flat=True)[:50])
+        words = [
+            word.strip('.,!?').lower()
+            for title in Question.objects.filter(id__in=question_ids[:50]).values_list('title', flat=True)
+            for word in title.split() if len(word) > 3
+        ]
+
+        def pick():
+            return {
+                'question_id': rng.choice(question_ids),
+                'answer_id': rng.choice(answer_ids),
+                'tag_id': rng.choice(tag_ids) if tag_ids else 0,
+                'page': rng.randint(1, 5),
+                'query': rng.choice(words)[:rng.randint(2, 8)] if words else 'qu',
+                'action': rng.choice(['like', 'dislike']),
+                'text': f"Benchmark answer {rng.randrange(10 ** 9)} " * 3,
+            }
+        return pick
+
+    def plan(self, entries, count, seed):
+        rng = random.Random(seed)
+        pick = self.values(rng)
+        weights = [entry['weight'] for entry in entries]
+        plan = []
+        for entry in rng.choices(entries, weights=weights, k=count):
+            values = pick()
+            plan.append((entry, fill(entry['path'], values), fill(entry.get('data', {}), values), rng.random()))
+        return plan
+
+    def sessions(self, count):
+        users = list(User.objects.filter(profile__isnull=False, is_staff=False).order_by('id')[:count])
+        if not users:
+            raise CommandError('No users with profiles found')
+        clients = []
+        for user in users:
+            client = Client(HTTP_HOST=self.host)
+            client.force_login(user)
+            clients.append(client)
+        return clients
+
+    def run_inprocess(self, plan, options):
+        anonymous = Client(HTTP_HOST=self.host)
+        clients = self.sessions(options['users'])
+        secure = settings.SECURE_SSL_REDIRECT
+        results = []
+        started = time.perf_counter()
+        for entry, path, data, choice in plan:
+            client = clients[int(choice * len(clients))] if entry.get('auth') else anonymous
+            method = client.post if entry['method'] == 'POST' else client.get
+            with CaptureQueriesContext(connection) as queries:
+                t = time.perf_counter()
+                response = method(path, data, secure=secure) if data else method(path, secure=secure)
+                elapsed = time.perf_counter() - t
+            results.append((entry['name'], elapsed, len(queries), response.status_code))
+        return results, time.perf_counter() - started
+
+    def run_gunicorn(self, plan, options):
+        cookies = [client.cookies[settings.SESSION_COOKIE_NAME].value for client in self.sessions(options['users'])]
+        env = {'PAGE_CACHE_ENABLED': 'false'} if options['no_page_cache'] else {}
+        server, base = start_server('wsgi', options['port'], options['workers'], options['threads'], **env)
+        host = base.split('://', 1)[1]
+        results = []
+        lock = threading.Lock()
+        concurrency = options['concurrency']
+
+        def client(offset):
+            session = requests.Session()
+            csrf = secrets.token_hex(16)
+            headers = {'X-Forwarded-Proto': 'https', 'Referer': f"https://{host}/", 'X-CSRFToken': csrf}
+            local = []
+            for entry, path, data, choice in plan[offset::concurrency]:
+                jar = {'csrftoken': csrf}
+                if entry.get('auth'):
+                    jar[settings.SESSION_COOKIE_NAME] = cookies[int(choice * len(cookies))]
+                t = time.perf_counter()
+                try:
+                    response = session.request(
+                        entry['method'], base + path, data=data or None, headers=headers, cookies=jar,
+                        allow_redirects=False, timeout=30
+                    )
+                    status = response.status_code
+                except requests.RequestException:
+                    status = 0
+                local.append((entry['name'], time.perf_counter() - t, None, status))
+                session.cookies.clear()
+            with lock:
+                results.extend(local)
+
+        try:
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return results, time.perf_counter() - started
+        finally:
+            stop_server(server)
+
+    def summarize(self, results, elapsed):
+        grouped = {}
+        for name, seconds, queries, status in results:
+            grouped.setdefault(name, []).append((seconds, queries, status))
+        grouped = dict(sorted(grouped.items()))
+        grouped['total'] = [(seconds, queries, status) for _, seconds, queries, status in results]
+
+        summary = {}
+        for name, rows in grouped.items():
+            timings = sorted(seconds * 1000 for seconds, _, _ in rows)
+            queries = [count for _, count, _ in rows if count is not None]
+            summary[name] = {
+                'requests': len(rows),
+                'errors': sum(1 for _, _, status in rows if status == 0 or status >= 400),
+                'rps': round(len(rows) / elapsed, 1) if elapsed else 0,
+                'p50_ms': round(percentile(timings, 0.5), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+                'queries': round(statistics.mean(queries), 2) if queries else None,
+            }
+        return summary
+
+    def report(self, summary, baseline, threshold):
+        regressions = []
+        self.stdout.write(f"{'endpoint':<16}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        for name, row in summary.items():
+            queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+            line = (
+                f"{name:<16}{row['requests']:>7}{row['errors']:>5}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{queries:>9}"
+            )
+            previous = (baseline or {}).get('endpoints', {}).get(name)
+            if previous:
+                notes = []
+                if previous['p95_ms'] and row['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                    notes.append(f"p95 {previous['p95_ms']:.1f} -> {row['p95_ms']:.1f}")
+                if previous['rps'] and row['rps'] < previous['rps'] * (1 - threshold):
+                    notes.append(f"req/s {previous['rps']:.1f} -> {row['rps']:.1f}")
+                if previous['queries'] is not None and row['queries'] is not None and row['queries'] > previous['queries'] + 0.5:
+                    notes.append(f"queries {previous['queries']:.1f} -> {row['queries']:.1f}")
+                if notes:
+                    regressions.append(name)
+                    line = self.style.ERROR(f"{line}  {', '.join(notes)}")
+            self.stdout.write(line)
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['fill']:
+            self.seed(options)
+        with open(options['traffic']) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        self.host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+        plan = self.plan(entries, options['requests'], options['seed'])
+        if options['mode'] == 'gunicorn':
+            results, elapsed = self.run_gunicorn(plan, options)
+        else:
+            if options['no_page_cache']:
+                os.environ['PAGE_CACHE_ENABLED'] = 'false'
+            results, elapsed = self.run_inprocess(plan, options)
+        summary = self.summarize(results, elapsed)
+
+        path = BENCH_DIR / 'baselines' / f"{options['baseline'] or options['mode']}.json"
+        baseline = json.loads(path.read_text()) if path.exists() else None
+        regressions = self.report(summary, baseline, options['threshold'])
+
+        if options['save']:
+            try:
+                commit = subprocess.run(
+                    ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True
+                ).stdout.strip() or None
+            except OSError:
+                commit = None
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'mode': options['mode'],
+                'commit': commit,
+                'requests': options['requests'],
+                'seed': options['seed'],
+                'fill_ratio': options['fill'],
+                'questions': Question.objects.count(),
+                'database': connection.vendor,
+                'cpus': os.cpu_count(),
+                'concurrency': options['concurrency'] if options['mode'] == 'gunicorn' else 1,
+                'page_cache': not options['no_page_cache'],
+                'endpoints': summary,
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f"> Baseline written to {path}")
+
+        if regressions and options['check']:
+            raise CommandError(f"Regressions against {path.name}: {', '.join(regressions)}")
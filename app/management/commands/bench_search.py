@@ -0,0 +1,64 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from app import search
+from app.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Compare search backends on the current dataset (run after fill_db)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--backends', default='legacy,fulltext')
+
+    def sample_queries(self, count, seed):
+        rng = random.Random(seed)
+        max_id = Question.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        queries = []
+        while max_id and len(queries) < count:
+            question = Question.objects.filter(id__gte=rng.randint(1, max_id)).order_by('id').only('title').first()
+            if question is None:
+                continue
+            words = [word.strip('.,!?').lower() for word in question.title.split()]
+            words = [word for word in words if len(word) > 2]
+            if not words:
+                continue
+            start = rng.randrange(len(words))
+            phrase = ' '.join(words[start:start + rng.randint(1, 3)])
+            if rng.random() < 0.3:
+                phrase = phrase[:max(2, len(phrase) - rng.randint(1, 3))]
+            queries.append(phrase)
+        return queries
+
+    def handle(self, *args, **options):
+        queries = self.sample_queries(options['queries'], options['seed'])
+        backends = options['backends'].split(',')
+        results = {}
+
+        for backend in backends:
+            timings = []
+            results[backend] = []
+            for query in queries:
+                t = time.perf_counter()
+                found = search.suggest(query, backend=backend)
+                timings.append((time.perf_counter() - t) * 1000)
+                results[backend].append([q.id for q in found])
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+            self.stdout.write(
+                f"> {backend}: {len(queries)} queries, mean {statistics.mean(timings or [0]):.2f}ms, "
+                f"p95 {p95:.2f}ms, max {max(timings or [0]):.2f}ms"
+            )
+
+        if len(backends) > 1 and queries:
+            base = backends[0]
+            for backend in backends[1:]:
+                overlaps = []
+                for expected, found in zip(results[base], results[backend]):
+                    if expected:
+                        overlaps.append(len(set(expected) & set(found)) / len(expected))
+                if overlaps:
+                    self.stdout.write(f"> top-10 overlap {backend} vs {base}: {statistics.mean(overlaps):.0%}")
@@ -0,0 +1,152 @@
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from app.models import Question, Tag
+
+
+def start_server(mode, port, workers, threads, **env):
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        GUNICORN_HOST='127.0.0.1',
+        GUNICORN_PORT=str(port),
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_MAX_REQUESTS='0',
+        GUNICORN_ACCESS_LOG=os.devnull,
+        GUNICORN_ERROR_LOG='-',
+        GUNICORN_LOG_LEVEL='warning',
+        GUNICORN_RELOAD='false',
+        **env,
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn' / 'gunicorn.conf.py')],
+        cwd=settings.BASE_DIR, env=env,
+    )
+
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError(f"{mode} server exited with code {server.returncode}")
+        try:
+            requests.get(f"{base}/hot/", timeout=2)
+            return server, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise CommandError(f"{mode} server did not start on port {port}")
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait(timeout=30)
+
+
+class Command(BaseCommand):
+    help = 'Compare req/s and latency of the sync (wsgi) and uvicorn (asgi) serving modes on the current dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=20)
+        parser.add_argument('--warmup', type=float, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--no-page-cache', action='store_true')
+
+    def sample_urls(self, count, seed):
+        rng = random.Random(seed)
+        question_ids = list(Question.objects.order_by('?').values_list('id', flat=True)[:200])
+        tag_ids = list(Tag.objects.order_by('-questions_count').values_list('id', flat=True)[:50])
+        titles = list(Question.objects.filter(id__in=question_ids[:50]).values_list('title', flat=True))
+        if not question_ids:
+            raise CommandError('No questions found, run fill_db first')
+
+        urls = []
+        for _ in range(count):
+            kind = rng.random()
+            if kind < 0.35:
+                urls.append(f"/question/{rng.choice(question_ids)}/")
+            elif kind < 0.55:
+                urls.append(f"/?page={rng.randint(1, 5)}")
+            elif kind < 0.7:
+                urls.append(f"/hot/?page={rng.randint(1, 5)}")
+            elif kind < 0.85 and tag_ids:
+                urls.append(f"/tag/{rng.choice(tag_ids)}/")
+            else:
+                words = rng.choice(titles).split()
+                urls.append(f"/search_questions/?q={rng.choice(words)[:rng.randint(2, 8)]}")
+        return urls
+
+    def drive(self, base, urls, concurrency, duration):
+        timings = []
+        errors = [0]
+        lock = threading.Lock()
+        stop_at = time.monotonic() + duration
+
+        def client(offset):
+            session = requests.Session()
+            local, failed = [], 0
+            index = offset
+            while time.monotonic() < stop_at:
+                url = urls[index % len(urls)]
+                index += concurrency
+                t = time.perf_counter()
+                try:
+                    response = session.get(base + url, timeout=30)
+                    if response.status_code >= 500:
+                        failed += 1
+                except requests.RequestException:
+                    failed += 1
+                local.append((time.perf_counter() - t) * 1000)
+            with lock:
+                timings.extend(local)
+                errors[0] += failed
+
+        started = time.monotonic()
+        clients = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return timings, errors[0], time.monotonic() - started
+
+    def handle(self, *args, **options):
+        urls = self.sample_urls(2000, options['seed'])
+        results = {}
+
+        for mode in options['modes'].split(','):
+            server, base = start_server(
+                mode, options['port'], options['workers'], options['threads'],
+                **({'PAGE_CACHE_ENABLED': 'false'} if options['no_page_cache'] else {})
+            )
+            try:
+                self.drive(base, urls, options['concurrency'], options['warmup'])
+                timings, errors, elapsed = self.drive(base, urls, options['concurrency'], options['duration'])
+            finally:
+                stop_server(server)
+
+            timings.sort()
+            results[mode] = len(timings) / elapsed if elapsed else 0
+            p50 = statistics.median(timings) if timings else 0
+            p99 = timings[int(len(timings) * 0.99) - 1] if timings else 0
+            self.stdout.write(
+                f"> {mode}: {len(timings)} requests, {results[mode]:.1f} req/s, "
+                f"p50 {p50:.1f}ms, p99 {p99:.1f}ms, errors {errors}"
+            )
+
+        if len(results) > 1:
+            base_mode = next(iter(results))
+            for mode, rate in list(results.items())[1:]:
+                if results[base_mode]:
+                    self.stdout.write(f"> {mode} vs {base_mode}: {rate / results[base_mode]:.2f}x req/s")
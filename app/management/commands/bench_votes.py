@@ -0,0 +1,127 @@
+import os
+import random
+import secrets
+import statistics
+import tempfile
+import threading
+import time
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from app import votes
+from app.management.commands.bench_server import start_server, stop_server
+from app.models import Question, Reaction
+
+
+class Command(BaseCommand):
+    help = 'Replay a vote spike on a few hot questions against rate_object, with and without write-behind buffering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='sync,write-behind')
+        parser.add_argument('--concurrency', default='1,4,16,32', help='Comma-separated client thread counts')
+        parser.add_argument('--requests', type=int, default=2000, help='Votes sent per run')
+        parser.add_argument('--objects', type=int, default=5, help='Hot questions receiving the spike')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4)
+
+    def sessions(self, count):
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+        cookies = []
+        for user in User.objects.filter(profile__isnull=False).order_by('id')[:count]:
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+            cookies.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+        if not cookies:
+            raise CommandError('No users with profiles found, run fill_db first')
+        return cookies
+
+    def drive(self, base, plan, cookies, concurrency):
+        host = base.split('://', 1)[1]
+        timings, statuses = [], []
+        lock = threading.Lock()
+
+        def client(offset):
+            session = requests.Session()
+            csrf = secrets.token_hex(16)
+            headers = {'X-Forwarded-Proto': 'https', 'Referer': f"https://{host}/", 'X-CSRFToken': csrf}
+            local = []
+            for user, question_id, action in plan[offset::concurrency]:
+                jar = {'csrftoken': csrf, settings.SESSION_COOKIE_NAME: cookies[user]}
+                t = time.perf_counter()
+                try:
+                    status = session.post(
+                        f"{base}/rate/", data={'id': question_id, 'action': action, 'type': 'question'},
+                        headers=headers, cookies=jar, allow_redirects=False, timeout=30
+                    ).status_code
+                except requests.RequestException:
+                    status = 0
+                local.append(((time.perf_counter() - t) * 1000, status))
+                session.cookies.clear()
+            with lock:
+                timings.extend(timing for timing, _ in local)
+                statuses.extend(status for _, status in local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(timings), statuses, time.perf_counter() - started
+
+    def drift(self, question_ids):
+        drifted = 0
+        for question in Question.objects.filter(id__in=question_ids):
+            reactions = Reaction.objects.filter(target_type=Reaction.QUESTION, target_id=question.id)
+            likes = reactions.filter(value=1).count()
+            dislikes = reactions.filter(value=-1).count()
+            drifted += question.likes_count != likes or question.dislikes_count != dislikes
+        return drifted
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        question_ids = list(Question.objects.order_by('-rating', 'id').values_list('id', flat=True)[:options['objects']])
+        if not question_ids:
+            raise CommandError('No questions found, run fill_db first')
+        cookies = self.sessions(options['users'])
+        plan = [
+            (rng.randrange(len(cookies)), rng.choice(question_ids), rng.choice(['like', 'like', 'dislike']))
+            for _ in range(options['requests'])
+        ]
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        for mode in options['modes'].split(','):
+            journal = tempfile.mkdtemp(prefix='votes-')
+            env = {
+                'VOTES_WRITE_BEHIND': 'true' if mode == 'write-behind' else 'false',
+                'VOTES_JOURNAL_DIR': journal,
+                'PAGE_CACHE_ENABLED': 'false',
+                'NPLUSONE_ENABLED': 'false',
+            }
+            rates = []
+            for concurrency in levels:
+                server, base = start_server('wsgi', options['port'], options['workers'], options['threads'], **env)
+                try:
+                    timings, statuses, elapsed = self.drive(base, plan, cookies, concurrency)
+                finally:
+                    stop_server(server)
+                votes.replay_orphans(journal)
+
+                errors = sum(1 for status in statuses if status != 200)
+                rate = len(timings) / elapsed if elapsed else 0
+                rates.append(rate)
+                self.stdout.write(
+                    f"> {mode} x{concurrency}: {rate:.1f} votes/s, p50 {statistics.median(timings):.1f}ms, "
+                    f"p99 {timings[int(len(timings) * 0.99) - 1]:.1f}ms, errors {errors}, "
+                    f"scaling {rate / rates[0] if rates[0] else 0:.2f}x"
+                )
+            drifted = self.drift(question_ids)
+            style = self.style.ERROR if drifted else self.style.SUCCESS
+            self.stdout.write(style(f"> {mode}: {drifted} of {len(question_ids)} hot questions drifted from their reaction rows"))
+            if not os.listdir(journal):
+                os.rmdir(journal)
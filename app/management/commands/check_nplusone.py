@@ -0,0 +1,105 @@
+import os
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import URLPattern, get_resolver, reverse
+from app import nplusone
+from app.models import Answer, Question, Tag
+
+
+def named_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+class Command(BaseCommand):
+    help = 'Request every named URL in ROOT_URLCONF and report repeated same-shape SQL queries (N+1 patterns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, help='Repeats of one query shape reported as N+1 (NPLUSONE_THRESHOLD)')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error when any N+1 pattern or 5xx is found')
+        parser.add_argument('--writes', action='store_true', help='Also POST to the write endpoints, rolled back afterwards')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache first so cached fragments are rendered too')
+        parser.add_argument('--url', action='append', default=[], help='Only check these URL names')
+
+    def fixtures(self):
+        question = Question.objects.order_by('-answers_count', 'id').first()
+        if question is None:
+            raise CommandError('No questions found, run fill_db first')
+        tag = Tag.objects.order_by('-questions_count', 'id').first()
+        answer = Answer.objects.filter(question=question).order_by('id').first()
+        word = next((word for word in question.title.split() if len(word) > 3), question.title.split()[0])
+
+        self.kwargs = {'question_id': question.id, 'tag_id': tag.id if tag else 0}
+        self.query = {
+            'index': {'page': 2},
+            'hot': {'page': 2},
+            'search_page': {'q': word},
+            'search_api': {'q': word},
+        }
+        self.posts = {
+            'rate_object': {'id': question.id, 'action': 'like', 'type': 'question'},
+            'question': {'text': 'Checking the answer form for repeated queries'},
+        }
+        if answer is not None:
+            self.posts['toggle_correct_answer'] = {'question_id': question.id, 'answer_id': answer.id, 'mark': 'true'}
+        return question.user
+
+    def clients(self, user):
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+        anonymous = Client(HTTP_HOST=host, raise_request_exception=False)
+        member = Client(HTTP_HOST=host, raise_request_exception=False)
+        member.force_login(user)
+        return [('anonymous', anonymous), (user.username, member)]
+
+    def inspect(self, client, method, path, data):
+        with nplusone.Detector(self.threshold) as detector:
+            if method == 'POST':
+                with transaction.atomic():
+                    response = client.post(path, data, secure=settings.SECURE_SSL_REDIRECT)
+                    transaction.set_rollback(True)
+            else:
+                response = client.get(path, data, secure=settings.SECURE_SSL_REDIRECT)
+        return response.status_code, sum(detector.counts.values()), detector.problems()
+
+    def handle(self, *args, **options):
+        os.environ['PAGE_CACHE_ENABLED'] = 'false'
+        os.environ['NPLUSONE_ENABLED'] = 'false'
+        self.threshold = options['threshold'] or nplusone.threshold()
+        if options['cold']:
+            cache.clear()
+
+        clients = self.clients(self.fixtures())
+        patterns = list(named_patterns(get_resolver().url_patterns))
+        if options['url']:
+            patterns = [pattern for pattern in patterns if pattern.name in options['url']]
+
+        found, failures = 0, 0
+        for pattern in patterns:
+            missing = set(pattern.pattern.converters) - set(self.kwargs)
+            if missing:
+                self.stdout.write(self.style.WARNING(f"> Skipping {pattern.name}: no value for {', '.join(sorted(missing))}"))
+                continue
+            path = reverse(pattern.name, kwargs={name: self.kwargs[name] for name in pattern.pattern.converters})
+            requests = [('GET', self.query.get(pattern.name, {}))]
+            if options['writes'] and pattern.name in self.posts:
+                requests.append(('POST', self.posts[pattern.name]))
+
+            for method, data in requests:
+                for client_name, client in clients:
+                    status, queries, problems = self.inspect(client, method, path, data)
+                    line = f"{method:<5}{path:<32}{client_name:<14}{status:>4}{queries:>6} queries"
+                    if status >= 500:
+                        failures += 1
+                        line = self.style.ERROR(line)
+                    self.stdout.write(line)
+                    for problem in problems:
+                        found += 1
+                        self.stdout.write(self.style.ERROR(f"    N+1: {nplusone.describe(problem)}"))
+
+        self.stdout.write(f"> {found} N+1 pattern(s), {failures} server error(s), threshold {self.threshold}")
+        if options['strict'] and (found or failures):
+            raise CommandError('N+1 check failed')
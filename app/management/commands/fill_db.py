@@ -1,174 +1,372 @@
+import multiprocessing
+import numpy as np
 import os
-import random
 import time
+from collections import deque
+from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from app.models import Question, Answer, Tag, Profile, LikeQuestion, DislikeQuestion, LikeAnswer, DislikeAnswer
+from django.db import connections, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from app import leaderboard, page_cache, search_cache
+from app.bulk_load import BulkWriter
+from app.models import Question, Answer, Tag, Profile, Reaction, FillCheckpoint
 from faker import Faker
 from tqdm import tqdm
 
-fake = Faker()
+
+USER_FIELDS = ['id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active', 'date_joined']
+PROFILE_FIELDS = ['user', 'name', 'avatar', 'rating']
+TAG_FIELDS = ['id', 'title', 'questions_count']
+QUESTION_FIELDS = [
+    'id', 'title', 'text', 'time_create', 'time_update', 'is_published', 'rating', 'user',
+    'likes_count', 'dislikes_count', 'answers_count', 'version',
+]
+TAG_LINK_FIELDS = ['question', 'tag']
+ANSWER_FIELDS = [
+    'id', 'text', 'is_correct', 'time_create', 'time_update', 'is_published', 'question', 'user', 'rating',
+    'likes_count', 'dislikes_count',
+]
+REACTION_FIELDS = ['user', 'target_type', 'target_id', 'value']
+
+
+def chunk_rng(plan):
+    fake = Faker()
+    fake.seed_instance(f"{plan['seed']}:{plan['chunk']}")
+    return np.random.default_rng([plan['seed'], plan['chunk']]), fake
+
+
+def sample_reactions(rng, targets, num_users, size):
+    size = min(size, targets * num_users)
+    target, user = np.divmod(rng.choice(targets * num_users, size=size, replace=False), num_users)
+    like = rng.random(size) < 0.5
+    return target, user, like
+
+
+def split_reactions(target, user, like, targets, object_base, user_base, target_type):
+    rows = [
+        (user_id, target_type, target_id, value)
+        for user_id, target_id, value in zip(
+            (user + user_base).tolist(), (target + object_base).tolist(), np.where(like, 1, -1).tolist()
+        )
+    ]
+    return rows, np.bincount(target[like], minlength=targets), np.bincount(target[~like], minlength=targets)
+
+
+def tally(values):
+    ids, counts = np.unique(values, return_counts=True)
+    return ids, counts
+
+
+def generate_questions(plan):
+    rng, fake = chunk_rng(plan)
+    weights = plan['weights']
+    num_users, user_base, num_tags = plan['num_users'], plan['user_base'], plan['num_tags']
+    questions, answers = plan['questions'], plan['answers']
+    now = plan['now']
+
+    authors = rng.integers(num_users, size=questions)
+    created = rng.integers(365 * 24 * 3600, size=questions)
+    tags_per_question = rng.integers(1, min(3, num_tags) + 1, size=questions)
+
+    answer_questions = np.sort(rng.integers(questions, size=answers))
+    answers_count = np.bincount(answer_questions, minlength=questions)
+    answerers = rng.integers(num_users, size=answers)
+    is_correct = rng.random(answers) < 0.1
+    answered = np.maximum(created[answer_questions] - rng.integers(30 * 24 * 3600, size=answers), 0)
+
+    question_reactions, question_likes, question_dislikes = split_reactions(
+        *sample_reactions(rng, questions, num_users, plan['reactions'] // 2),
+        questions, plan['question_base'], user_base, Reaction.QUESTION
+    )
+    answer_reactions, answer_likes, answer_dislikes = split_reactions(
+        *sample_reactions(rng, max(answers, 1), num_users, plan['reactions'] - plan['reactions'] // 2 if answers else 0),
+        max(answers, 1), plan['answer_base'], user_base, Reaction.ANSWER
+    )
+
+    question_rating = (
+        weights['like'] * question_likes + weights['dislike'] * question_dislikes + weights['comment'] * answers_count
+    )
+    answer_rating = (
+        weights['like'] * answer_likes[:answers] + weights['dislike'] * answer_dislikes[:answers] +
+        weights['correct'] * is_correct
+    )
+
+    question_times = [now - timedelta(seconds=seconds) for seconds in created.tolist()]
+    answer_times = [now - timedelta(seconds=seconds) for seconds in answered.tolist()]
+    tags = [rng.choice(num_tags, size=count, replace=False) for count in tags_per_question.tolist()]
+    tag_links = [
+        (plan['question_base'] + i, plan['tag_base'] + tag)
+        for i, question_tags in enumerate(tags)
+        for tag in question_tags.tolist()
+    ]
+
+    return {
+        'position': plan['chunk'] + questions,
+        'questions': [
+            (plan['question_base'] + i, fake.sentence(nb_words=6), fake.text(max_nb_chars=800), time_create, time_create,
+             True, rating, user_base + author, likes, dislikes, count, 1)
+            for i, (time_create, rating, author, likes, dislikes, count) in enumerate(zip(
+                question_times, question_rating.tolist(), authors.tolist(), question_likes.tolist(),
+                question_dislikes.tolist(), answers_count.tolist(),
+            ))
+        ],
+        'tag_links': tag_links,
+        'answers': [
+            (plan['answer_base'] + i, fake.text(max_nb_chars=800), correct, time_create, time_create, True,
+             plan['question_base'] + question, user_base + answerer, rating, likes, dislikes)
+            for i, (correct, time_create, question, answerer, rating, likes, dislikes) in enumerate(zip(
+                is_correct.tolist(), answer_times, answer_questions.tolist(), answerers.tolist(), answer_rating.tolist(),
+                answer_likes.tolist(), answer_dislikes.tolist(),
+            ))
+        ],
+        'reactions': question_reactions + answer_reactions,
+        'user_questions': tally(authors),
+        'user_answers': tally(answerers),
+        'user_correct': tally(answerers[is_correct]),
+        'tag_counts': tally(np.concatenate(tags) if tags else np.array([], dtype=np.int64)),
+    }
+
+
+def generate_profiles(plan):
+    fake = Faker()
+    fake.seed_instance(f"{plan['seed']}:profiles:{plan['start']}")
+    return [
+        (plan['user_base'] + i, fake.name(), 'avatars/default.png', rating)
+        for i, rating in zip(range(plan['start'], plan['end']), plan['ratings'])
+    ]
+
+
+SCALES = {
+    'small': {'users': 10, 'tags': 10, 'questions': 100, 'answers': 1000, 'reactions': 2000},
+    'medium': {'users': 1000, 'tags': 1000, 'questions': 10000, 'answers': 100000, 'reactions': 200000},
+    'large': {'users': 10000, 'tags': 10000, 'questions': 100000, 'answers': 1000000, 'reactions': 2000000},
+    'huge': {'users': 100000, 'tags': 20000, 'questions': 1000000, 'answers': 10000000, 'reactions': 20000000},
+}
+PHASES = ['users', 'tags', 'questions', 'profiles', 'tag_counters']
+TALLIES = ['user_questions', 'user_answers', 'user_correct']
 
 
 class Command(BaseCommand):
-    help = 'Fill the database with test data'
+    help = 'Fill the database with test data (resumes an interrupted run from its last committed chunk)'
 
     def add_arguments(self, parser):
-        parser.add_argument('ratio', type=int)
+        parser.add_argument('ratio', type=int, nargs='?', default=int(os.getenv('FILL_DB_RATIO') or '10'))
+        parser.add_argument('--scale', choices=list(SCALES), default=os.getenv('FILL_DB_SCALE') or None,
+                            help='Use a fixed dataset profile instead of the ratio')
+        parser.add_argument('--workers', type=int, default=int(os.getenv('FILL_DB_WORKERS', '0')) or os.cpu_count() or 1)
+        parser.add_argument('--seed', type=int, default=int(os.getenv('FILL_DB_SEED', '42')),
+                            help='Same seed, ratio and chunk size produce the same dataset')
+        parser.add_argument('--chunk-size', type=int, default=int(os.getenv('FILL_DB_CHUNK_SIZE', '500')),
+                            help='Questions generated per worker task')
+        parser.add_argument('--restart', action='store_true', help='Abandon an interrupted run and start a new one')
 
-    def handle(self, *args, **options):
+    def run_chunks(self, function, plans, workers):
+        if workers <= 1:
+            for plan in plans:
+                yield function(plan)
+            return
+
+        connections.close_all()
+        with multiprocessing.Pool(workers) as pool:
+            pending = deque()
+            for plan in plans:
+                pending.append(pool.apply_async(function, (plan,)))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def counts(self, options):
+        if options['scale']:
+            return dict(SCALES[options['scale']])
         ratio = options['ratio']
+        return {
+            'users': max(1, ratio * int(os.getenv('FILL_DB_USERS_RATIO', '1'))),
+            'tags': max(1, ratio * int(os.getenv('FILL_DB_TAGS_RATIO', '1'))),
+            'questions': ratio * int(os.getenv('FILL_DB_QUESTIONS_RATIO', '10')),
+            'answers': ratio * int(os.getenv('FILL_DB_ANSWERS_RATIO', '100')),
+            'reactions': ratio * int(os.getenv('FILL_DB_REACTIONS_RATIO', '200')),
+        }
 
-        rating_weights = {
-            "like": int(os.getenv('RATING_WEIGHT_LIKE', '1')),
-            "dislike": int(os.getenv('RATING_WEIGHT_DISLIKE', '-1')),
-            "comment": int(os.getenv('RATING_WEIGHT_COMMENT', '3')),
-            "correct": int(os.getenv('RATING_WEIGHT_CORRECT', '5')),
-            "question": int(os.getenv('RATING_WEIGHT_QUESTION', '2')),
+    def new_run(self, options):
+        def next_id(model):
+            return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+        params = {
+            'counts': self.counts(options),
+            'seed': options['seed'],
+            'chunk_size': max(1, options['chunk_size']),
+            'batch_size': int(os.getenv('FILL_DB_BATCH_SIZE', '10000')),
+            'now': timezone.now().isoformat(),
+            'weights': {
+                "like": int(os.getenv('RATING_WEIGHT_LIKE', '1')),
+                "dislike": int(os.getenv('RATING_WEIGHT_DISLIKE', '-1')),
+                "comment": int(os.getenv('RATING_WEIGHT_COMMENT', '3')),
+                "correct": int(os.getenv('RATING_WEIGHT_CORRECT', '5')),
+                "question": int(os.getenv('RATING_WEIGHT_QUESTION', '2')),
+            },
+            'user_base': next_id(User),
+            'tag_base': next_id(Tag),
+            'question_base': next_id(Question),
+            'answer_base': next_id(Answer),
+            'user_offset': User.objects.filter(username__startswith='user_').count(),
+            'tag_offset': Tag.objects.filter(title__startswith='tag_').count(),
         }
+        return FillCheckpoint.objects.create(params=params, phase=PHASES[0])
 
-        users_ratio = int(os.getenv('FILL_DB_USERS_RATIO', '1'))
-        tags_ratio = int(os.getenv('FILL_DB_TAGS_RATIO', '1'))
-        questions_ratio = int(os.getenv('FILL_DB_QUESTIONS_RATIO', '10'))
-        answers_ratio = int(os.getenv('FILL_DB_ANSWERS_RATIO', '100'))
-        reactions_ratio = int(os.getenv('FILL_DB_REACTIONS_RATIO', '200'))
-        batch_size = int(os.getenv('FILL_DB_BATCH_SIZE', '10000'))
+    def recover_tallies(self, params):
+        counts, user_base = params['counts'], params['user_base']
+        self.tallies = {field: np.zeros(counts['users'], dtype=np.int64) for field in TALLIES}
+        self.tag_counts = np.zeros(counts['tags'], dtype=np.int64)
 
-        num_users = ratio * users_ratio
-        num_tags = ratio * tags_ratio
-        num_questions = ratio * questions_ratio
-        num_answers = ratio * answers_ratio
-        num_reactions = ratio * reactions_ratio
+        def add(counters, rows, base):
+            rows = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+            np.add.at(counters, rows[:, 0] - base, rows[:, 1])
 
-        def log(section):
-            self.stdout.write(self.style.NOTICE(f"\n--- {section} ---"))
+        questions = Question.objects.filter(pk__gte=params['question_base']).order_by()
+        answers = Answer.objects.filter(pk__gte=params['answer_base']).order_by()
+        links = Question.tags.through.objects.filter(question_id__gte=params['question_base']).order_by()
+        add(self.tallies['user_questions'], questions.values('user').annotate(n=Count('*')).values_list('user', 'n'), user_base)
+        add(self.tallies['user_answers'], answers.values('user').annotate(n=Count('*')).values_list('user', 'n'), user_base)
+        add(self.tallies['user_correct'], answers.filter(is_correct=True).values('user').annotate(n=Count('*'))
+            .values_list('user', 'n'), user_base)
+        add(self.tag_counts, links.values('tag').annotate(n=Count('*')).values_list('tag', 'n'), params['tag_base'])
 
-        start_all = time.time()
+    def users_chunks(self, params, start):
+        batch_size = params['batch_size']
+        now = datetime.fromisoformat(params['now'])
+        for chunk_start in range(start, params['counts']['users'], batch_size):
+            end = min(chunk_start + batch_size, params['counts']['users'])
+            yield end, [(self.writer.write, User, USER_FIELDS, [
+                (params['user_base'] + i, '', False, f"user_{params['user_offset'] + i}", '', '', '', False, True, now)
+                for i in range(chunk_start, end)
+            ])]
 
-        log("Creating users")
-        t = time.time()
-        users = [User(username=f"user_{i}") for i in tqdm(range(num_users), desc="Users")]
-        User.objects.bulk_create(users, batch_size=batch_size)
-        users = list(User.objects.all())
-        print(f"> Users created in {time.time() - t:.2f}s")
+    def tags_chunks(self, params, start):
+        batch_size = params['batch_size']
+        for chunk_start in range(start, params['counts']['tags'], batch_size):
+            end = min(chunk_start + batch_size, params['counts']['tags'])
+            yield end, [(self.writer.write, Tag, TAG_FIELDS, [
+                (params['tag_base'] + i, f"tag_{params['tag_offset'] + i}", 0) for i in range(chunk_start, end)
+            ])]
 
-        log("Creating profiles")
-        t = time.time()
-        profiles = [Profile(user=u, name=fake.name(), avatar='avatars/default.png') for u in
-                    tqdm(users, desc="Profiles")]
-        Profile.objects.bulk_create(profiles, batch_size=batch_size)
-        print(f"> Profiles created in {time.time() - t:.2f}s")
+    def questions_chunks(self, params, start):
+        counts, chunk_size = params['counts'], params['chunk_size']
+        now = datetime.fromisoformat(params['now'])
 
-        log("Creating tags")
-        t = time.time()
-        tags = [Tag(title=f"tag_{i}") for i in tqdm(range(num_tags), desc="Tags")]
-        Tag.objects.bulk_create(tags, batch_size=batch_size)
-        tags = list(Tag.objects.all())
-        print(f"> Tags created in {time.time() - t:.2f}s")
+        def plans():
+            for chunk_start in range(start, counts['questions'], chunk_size):
+                end = min(chunk_start + chunk_size, counts['questions'])
+                answers_start = counts['answers'] * chunk_start // counts['questions']
+                answers_end = counts['answers'] * end // counts['questions']
+                reactions_start = counts['reactions'] * chunk_start // counts['questions']
+                reactions_end = counts['reactions'] * end // counts['questions']
+                yield {
+                    'seed': params['seed'], 'chunk': chunk_start, 'now': now, 'weights': params['weights'],
+                    'question_base': params['question_base'] + chunk_start, 'questions': end - chunk_start,
+                    'answer_base': params['answer_base'] + answers_start, 'answers': answers_end - answers_start,
+                    'reactions': reactions_end - reactions_start,
+                    'user_base': params['user_base'], 'num_users': counts['users'],
+                    'tag_base': params['tag_base'], 'num_tags': counts['tags'],
+                }
 
-        log("Creating questions")
-        t = time.time()
-        questions = []
-        for _ in tqdm(range(num_questions), desc="Questions"):
-            q = Question(
-                title=fake.sentence(nb_words=6),
-                text=fake.text(max_nb_chars=800),
-                user=random.choice(users),
-                rating=0
-            )
-            questions.append(q)
-        Question.objects.bulk_create(questions, batch_size=batch_size)
-        questions = list(Question.objects.all())
-        print(f"> Questions created in {time.time() - t:.2f}s")
+        for chunk in self.run_chunks(generate_questions, plans(), self.workers):
+            yield chunk['position'], [
+                (self.writer.write, Question, QUESTION_FIELDS, chunk['questions']),
+                (self.writer.write, Question.tags.through, TAG_LINK_FIELDS, chunk['tag_links']),
+                (self.writer.write, Answer, ANSWER_FIELDS, chunk['answers']),
+                (self.writer.write, Reaction, REACTION_FIELDS, chunk['reactions']),
+            ]
+            for field, counters in self.tallies.items():
+                np.add.at(counters, *chunk[field])
+            np.add.at(self.tag_counts, *chunk['tag_counts'])
 
-        log("Assigning tags to questions")
-        t = time.time()
-        through_model = Question.tags.through
-        tag_links = []
-        for q in tqdm(questions, desc="Tag Links"):
-            for tag in random.sample(tags, random.randint(1, 3)):
-                tag_links.append(through_model(question_id=q.id, tag_id=tag.id))
-        through_model.objects.bulk_create(tag_links, batch_size=batch_size)
-        print(f"> Tags assigned in {time.time() - t:.2f}s")
-
-        log("Creating answers")
-        t = time.time()
-        answers = []
-        for _ in tqdm(range(num_answers), desc="Answers"):
-            is_correct = random.random() < 0.1
-            likes = random.randint(0, 5)
-            dislikes = random.randint(0, 3)
-            answer_rating = (
-                    rating_weights["like"] * likes +
-                    rating_weights["dislike"] * dislikes +
-                    (rating_weights["correct"] if is_correct else 0)
-            )
-            answers.append(Answer(
-                text=fake.text(max_nb_chars=800),
-                user=random.choice(users),
-                question=random.choice(questions),
-                is_correct=is_correct,
-                rating=answer_rating
+    def profiles_chunks(self, params, start):
+        weights, batch_size = params['weights'], params['batch_size']
+        ratings = (
+            weights["question"] * self.tallies['user_questions'] +
+            weights["comment"] * self.tallies['user_answers'] +
+            weights["correct"] * self.tallies['user_correct']
+        )
+
+        def plans():
+            for chunk_start in range(start, params['counts']['users'], batch_size):
+                end = min(chunk_start + batch_size, params['counts']['users'])
+                yield {
+                    'seed': params['seed'], 'user_base': params['user_base'], 'start': chunk_start, 'end': end,
+                    'ratings': ratings[chunk_start:end].tolist(),
+                }
+
+        for rows in self.run_chunks(generate_profiles, plans(), self.workers):
+            yield rows[-1][0] - params['user_base'] + 1, [(self.writer.write, Profile, PROFILE_FIELDS, rows)]
+
+    def tag_counters_chunks(self, params, start):
+        batch_size = params['batch_size']
+        for chunk_start in range(start, params['counts']['tags'], batch_size):
+            end = min(chunk_start + batch_size, params['counts']['tags'])
+            yield end, [(self.writer.update, Tag, 'questions_count', [
+                (params['tag_base'] + i, count)
+                for i, count in enumerate(self.tag_counts[chunk_start:end].tolist(), chunk_start) if count
+            ])]
+
+    def phase_total(self, params, phase):
+        if phase == 'questions':
+            return -(-params['counts']['questions'] // params['chunk_size'])
+        counted = params['counts']['tags'] if phase in ('tags', 'tag_counters') else params['counts']['users']
+        return -(-counted // params['batch_size'])
+
+    def phase_done(self, params, phase, position):
+        if phase == 'questions':
+            return position // params['chunk_size']
+        return position // params['batch_size']
+
+    def handle(self, *args, **options):
+        self.workers = options['workers']
+        start_all = time.time()
+
+        run = FillCheckpoint.objects.filter(is_done=False).order_by('-pk').first()
+        if run is not None and options['restart']:
+            FillCheckpoint.objects.filter(is_done=False).update(is_done=True)
+            run = None
+        if run is None:
+            run = self.new_run(options)
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Resuming the run started at {run.time_create:%Y-%m-%d %H:%M:%S} from {run.phase} #{run.position} "
+                f"(its own size and seed are used, pass --restart to start over)"
             ))
-        Answer.objects.bulk_create(answers, batch_size=batch_size)
-        answers = list(Answer.objects.all())
-        print(f"> Answers created in {time.time() - t:.2f}s")
+        params = run.params
+        self.writer = BulkWriter(params['batch_size'])
+        self.recover_tallies(params)
+        self.stdout.write(f"Loading {params['counts']} with {self.writer.method}, {self.workers} worker(s)")
 
-        log("Updating question ratings")
-        t = time.time()
-        question_answers = {q.id: 0 for q in questions}
-        for a in answers:
-            question_answers[a.question_id] += 1
-
-        for q in tqdm(questions, desc="Question ratings"):
-            likes = random.randint(0, 10)
-            dislikes = random.randint(0, 5)
-            comment_count = question_answers.get(q.id, 0)
-            q.rating = (
-                    rating_weights["like"] * likes +
-                    rating_weights["dislike"] * dislikes +
-                    rating_weights["comment"] * comment_count
+        for phase in PHASES[PHASES.index(run.phase):]:
+            start = run.position if phase == run.phase else 0
+            self.stdout.write(self.style.NOTICE(f"\n--- Loading {phase} ---"))
+            t = time.time()
+            progress = tqdm(
+                total=self.phase_total(params, phase), initial=self.phase_done(params, phase, start), desc=phase.capitalize()
             )
-        Question.objects.bulk_update(questions, ['rating'])
-        print(f"> Questions updated in {time.time() - t:.2f}s")
+            for position, writes in getattr(self, f"{phase}_chunks")(params, start):
+                with transaction.atomic():
+                    for method, model, fields, rows in writes:
+                        method(model, fields, rows)
+                    FillCheckpoint.objects.filter(pk=run.pk).update(phase=phase, position=position, time_update=timezone.now())
+                progress.update(1)
+            progress.close()
+            run.phase, run.position = phase, 0
+            print(f"> {phase} loaded in {time.time() - t:.2f}s")
 
-        log("Updating profile ratings")
-        t = time.time()
-        profiles = list(Profile.objects.select_related('user').all())
-        for p in tqdm(profiles, desc="Profile ratings"):
-            uq = p.user.questions.count()
-            ua = p.user.answers.count()
-            uc = p.user.answers.filter(is_correct=True).count()
-            p.rating = (
-                    rating_weights["question"] * uq +
-                    rating_weights["comment"] * ua +
-                    rating_weights["correct"] * uc
-            )
-        Profile.objects.bulk_update(profiles, ['rating'])
-        print(f"> Profiles updated in {time.time() - t:.2f}s")
+        FillCheckpoint.objects.filter(pk=run.pk).update(is_done=True, time_update=timezone.now())
 
-        log("Creating reactions")
+        self.stdout.write(self.style.NOTICE("\n--- Refreshing caches ---"))
         t = time.time()
-        like_q, dislike_q, like_a, dislike_a = [], [], [], []
-        for _ in tqdm(range(num_reactions), desc="Reactions"):
-            user = random.choice(users)
-            if random.random() < 0.5:
-                q = random.choice(questions)
-                if random.random() < 0.5:
-                    like_q.append(LikeQuestion(user=user, question=q))
-                else:
-                    dislike_q.append(DislikeQuestion(user=user, question=q))
-            else:
-                a = random.choice(answers)
-                if random.random() < 0.5:
-                    like_a.append(LikeAnswer(user=user, answer=a))
-                else:
-                    dislike_a.append(DislikeAnswer(user=user, answer=a))
-
-        LikeQuestion.objects.bulk_create(like_q, ignore_conflicts=True, batch_size=batch_size)
-        DislikeQuestion.objects.bulk_create(dislike_q, ignore_conflicts=True, batch_size=batch_size)
-        LikeAnswer.objects.bulk_create(like_a, ignore_conflicts=True, batch_size=batch_size)
-        DislikeAnswer.objects.bulk_create(dislike_a, ignore_conflicts=True, batch_size=batch_size)
-        print(f"> Reactions created in {time.time() - t:.2f}s")
-
-        self.stdout.write(self.style.SUCCESS(f"\n✅ Done in {time.time() - start_all:.2f}s"))
+        leaderboard.rebuild_popular_tags()
+        leaderboard.rebuild_top_users()
+        search_cache.bump_generation()
+        page_cache.purge('questions')
+        print(f"> Caches refreshed in {time.time() - t:.2f}s")
+
+        self.stdout.write(self.style.SUCCESS(f"\n✅ {self.writer.rows} rows loaded in {time.time() - start_all:.2f}s"))
@@ -0,0 +1,18 @@
+import os
+from django.core.management.base import BaseCommand
+from app import votes
+
+
+class Command(BaseCommand):
+    help = 'Replay write-behind vote journals left behind by stopped or crashed processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Journal directory (VOTES_JOURNAL_DIR)')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or votes.journal_dir()
+        if not directory or not os.path.isdir(directory):
+            self.stdout.write(f"> No vote journal directory at {directory or '(disabled)'}")
+            return
+        replayed = votes.replay_orphans(directory)
+        self.stdout.write(f"> Replayed {replayed} votes from {directory}")
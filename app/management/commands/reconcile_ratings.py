@@ -0,0 +1,85 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from app.management.commands.recount_counters import count_subquery
+from app.models import Question, Answer, Profile, Reaction, rating
+
+
+RATINGS = [
+    (Question, (
+        count_subquery(Reaction, 'target_id', target_type=Reaction.QUESTION, value=1) * Value(rating['like']) +
+        count_subquery(Reaction, 'target_id', target_type=Reaction.QUESTION, value=-1) * Value(rating['dislike']) +
+        count_subquery(Answer, 'question') * Value(rating['comment'])
+    )),
+    (Answer, (
+        count_subquery(Reaction, 'target_id', target_type=Reaction.ANSWER, value=1) * Value(rating['like']) +
+        count_subquery(Reaction, 'target_id', target_type=Reaction.ANSWER, value=-1) * Value(rating['dislike']) +
+        Case(When(is_correct=True, then=Value(rating['correct'])), default=Value(0), output_field=IntegerField())
+    )),
+    (Profile, (
+        count_subquery(Question, 'user', outer='user') * Value(rating['question']) +
+        count_subquery(Answer, 'user', outer='user') * Value(rating['comment']) +
+        count_subquery(Answer, 'user', outer='user', is_correct=True) * Value(rating['correct'])
+    )),
+]
+
+
+class Command(BaseCommand):
+    help = 'Recompute ratings from scratch and report drift from the incrementally maintained values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted ratings with the recomputed values')
+        parser.add_argument('--batch-size', type=int, default=int(os.getenv('RECOUNT_BATCH_SIZE', '5000')))
+        parser.add_argument('--examples', type=int, default=5, help='How many drifted objects to print per model')
+
+    def handle(self, *args, **options):
+        fix = options['fix']
+        batch_size = options['batch_size']
+        drifted_total = 0
+
+        for model, expression in RATINGS:
+            t = time.time()
+            checked, drifted, drift_sum = 0, 0, 0
+            examples = []
+            last_pk = 0
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', 'rating').annotate(actual_rating=expression)[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                checked += len(batch)
+
+                changed = []
+                for obj in batch:
+                    stored = obj.rating or 0
+                    if stored != obj.actual_rating:
+                        drift_sum += abs(stored - obj.actual_rating)
+                        if len(examples) < options['examples']:
+                            examples.append((obj.pk, stored, obj.actual_rating))
+                        obj.rating = obj.actual_rating
+                        changed.append(obj)
+                drifted += len(changed)
+
+                if changed and fix:
+                    with transaction.atomic():
+                        model.objects.bulk_update(changed, ['rating'], batch_size=batch_size)
+
+            drifted_total += drifted
+            self.stdout.write(
+                f"> {model.__name__}: {checked} checked, {drifted} drifted "
+                f"(total drift {drift_sum}) in {time.time() - t:.2f}s"
+            )
+            for pk, stored, actual in examples:
+                self.stdout.write(f"    id={pk}: stored {stored}, recomputed {actual}")
+
+        if not drifted_total:
+            self.stdout.write(self.style.SUCCESS("Ratings are consistent"))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"{drifted_total} ratings fixed"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifted_total} ratings drifted, run with --fix to repair them"))
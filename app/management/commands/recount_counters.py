@@ -0,0 +1,82 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from app.models import Question, Answer, Tag, Reaction
+
+
+def count_subquery(model, field, outer='pk', **filters):
+    rows = model.objects.filter(**{field: OuterRef(outer)}, **filters).order_by().values(field).annotate(total=Count('*'))
+    return Coalesce(Subquery(rows.values('total'), output_field=IntegerField()), Value(0))
+
+
+COUNTERS = [
+    (Question, {
+        'likes_count': count_subquery(Reaction, 'target_id', target_type=Reaction.QUESTION, value=1),
+        'dislikes_count': count_subquery(Reaction, 'target_id', target_type=Reaction.QUESTION, value=-1),
+        'answers_count': count_subquery(Answer, 'question'),
+    }),
+    (Answer, {
+        'likes_count': count_subquery(Reaction, 'target_id', target_type=Reaction.ANSWER, value=1),
+        'dislikes_count': count_subquery(Reaction, 'target_id', target_type=Reaction.ANSWER, value=-1),
+    }),
+    (Tag, {
+        'questions_count': count_subquery(Question.tags.through, 'tag'),
+    }),
+]
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored like/dislike/answer/question counters from the reaction, answer and tag tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report counters that are out of sync')
+        parser.add_argument('--batch-size', type=int, default=int(os.getenv('RECOUNT_BATCH_SIZE', '5000')))
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+        out_of_sync_total = 0
+
+        for model, expressions in COUNTERS:
+            t = time.time()
+            fields = list(expressions)
+            annotations = {f"actual_{field}": expression for field, expression in expressions.items()}
+            checked, out_of_sync = 0, 0
+            last_pk = 0
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', *fields).annotate(**annotations)[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                checked += len(batch)
+
+                changed = []
+                for obj in batch:
+                    if any(getattr(obj, field) != getattr(obj, f"actual_{field}") for field in fields):
+                        for field in fields:
+                            setattr(obj, field, getattr(obj, f"actual_{field}"))
+                        changed.append(obj)
+                out_of_sync += len(changed)
+
+                if changed and not check_only:
+                    with transaction.atomic():
+                        model.objects.bulk_update(changed, fields, batch_size=batch_size)
+                        if model is Question:
+                            Question.objects.filter(pk__in=[obj.pk for obj in changed]).update(version=F('version') + 1)
+
+            out_of_sync_total += out_of_sync
+            action = 'found' if check_only else 'fixed'
+            self.stdout.write(
+                f"> {model.__name__}: {checked} checked, {out_of_sync} out of sync {action} in {time.time() - t:.2f}s"
+            )
+
+        if out_of_sync_total and check_only:
+            self.stdout.write(self.style.WARNING(f"{out_of_sync_total} objects have stale counters"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Counters are in sync"))
@@ -0,0 +1,5 @@
+from django.core.management import call_command
+
+
+def reconcile_ratings() -> None:
+    call_command('reconcile_ratings', fix=True)
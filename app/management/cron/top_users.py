@@ -1,9 +1,5 @@
-import os
-from app.models import *
-from django.core.cache import cache
+from app import leaderboard
 
 
 def update_top_users() -> None:
-    ttl = int(os.getenv('TOP_USERS_CACHE_TTL', '604800'))
-    top_users = Profile.objects.all().order_by('-rating')[:10]
-    cache.set('top_users', top_users, ttl)
+    leaderboard.rebuild_top_users()
@@ -0,0 +1,406 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.template.backends.django import DjangoTemplates
+from django.urls import Resolver404, resolve
+
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_SQL_SECONDS = float(os.getenv('METRICS_SLOW_SQL_MS', '100')) / 1000
+SLOW_SQL_SAMPLE = float(os.getenv('METRICS_SLOW_SQL_SAMPLE', '0.1'))
+
+current = ContextVar('request_metrics', default=None)
+_cache_nested = ContextVar('cache_nested', default=False)
+
+_lock = threading.Lock()
+_views = {}
+_slow_queries = deque(maxlen=int(os.getenv('METRICS_SLOW_SQL_KEEP', '50')))
+_process_path = None
+_process_pid = None
+_dumper_pid = None
+
+
+def enabled():
+    return os.getenv('METRICS_ENABLED', 'true').lower() in ('true', '1', 't')
+
+
+def shared_dir():
+    return os.getenv('METRICS_DIR', '/app/logs/metrics')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, snapshot):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, snapshot['counts'])]
+        self.sum += snapshot['sum']
+        self.count += snapshot['count']
+
+    def snapshot(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+def new_view():
+    return {
+        'requests': {},
+        'duration': Histogram(DURATION_BUCKETS),
+        'db_duration': Histogram(DURATION_BUCKETS),
+        'render_duration': Histogram(DURATION_BUCKETS),
+        'queries': Histogram(QUERY_BUCKETS),
+        'cache_gets': 0,
+        'cache_misses': 0,
+    }
+
+
+def snapshot_view(view):
+    snapshot = dict(view, requests=dict(view['requests']))
+    for key, value in view.items():
+        if isinstance(value, Histogram):
+            snapshot[key] = value.snapshot()
+    return snapshot
+
+
+def merge_view(view, snapshot):
+    for key, value in snapshot.items():
+        if key == 'requests':
+            for status_class, count in value.items():
+                view['requests'][status_class] = view['requests'].get(status_class, 0) + count
+        elif isinstance(value, dict):
+            view[key].merge(value)
+        else:
+            view[key] += value
+
+
+def new_state():
+    return {'queries': 0, 'db_time': 0.0, 'render_time': 0.0, 'render_depth': 0, 'cache_gets': 0, 'cache_misses': 0, 'slow': []}
+
+
+def query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        state = current.get()
+        if state is not None:
+            state['queries'] += 1
+            state['db_time'] += elapsed
+            if elapsed >= SLOW_SQL_SECONDS and random.random() < SLOW_SQL_SAMPLE:
+                state['slow'].append((sql, elapsed))
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def count_cache(gets, misses):
+    state = current.get()
+    if state is not None:
+        state['cache_gets'] += gets
+        state['cache_misses'] += misses
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved'
+    return match.url_name or match.view_name
+
+
+def record(request, state, status, duration):
+    name = view_name(request)
+    with _lock:
+        view = _views.setdefault(name, new_view())
+        status_class = f"{status // 100}xx"
+        view['requests'][status_class] = view['requests'].get(status_class, 0) + 1
+        view['duration'].observe(duration)
+        view['db_duration'].observe(state['db_time'])
+        view['render_duration'].observe(state['render_time'])
+        view['queries'].observe(state['queries'])
+        view['cache_gets'] += state['cache_gets']
+        view['cache_misses'] += state['cache_misses']
+        for sql, elapsed in state['slow']:
+            _slow_queries.append({'view': name, 'ms': round(elapsed * 1000, 2), 'sql': sql[:2000], 'time': time.time()})
+    for sql, elapsed in state['slow']:
+        logger.warning("Slow query in %s (%.1fms): %s", name, elapsed * 1000, sql[:2000])
+    if shared_dir() and _dumper_pid != os.getpid():
+        start_dumper()
+
+
+def process_path():
+    global _process_path, _process_pid
+    if _process_pid != os.getpid():
+        _process_pid = os.getpid()
+        _process_path = os.path.join(shared_dir(), f"{socket.gethostname()}-{_process_pid}-{time.time_ns()}.json")
+    return _process_path
+
+
+def own_snapshot():
+    with _lock:
+        return {'views': {name: snapshot_view(view) for name, view in _views.items()}, 'slow': list(_slow_queries)}
+
+
+def dump(snapshot=None):
+    snapshot = snapshot or own_snapshot()
+    path = process_path()
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception("Failed to write the metrics snapshot to %s", path)
+
+
+def dump_at_exit():
+    if _process_pid == os.getpid():
+        dump()
+
+
+atexit.register(dump_at_exit)
+
+
+def dump_loop():
+    while True:
+        time.sleep(float(os.getenv('METRICS_DUMP_INTERVAL', '5')))
+        if _dumper_pid != os.getpid():
+            return
+        if _process_pid == os.getpid() and shared_dir():
+            dump()
+
+
+def start_dumper():
+    global _dumper_pid
+    with _lock:
+        if _dumper_pid == os.getpid():
+            return
+        _dumper_pid = os.getpid()
+    process_path()
+    threading.Thread(target=dump_loop, name='metrics-dumper', daemon=True).start()
+
+
+def read_snapshot(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning("Skipping unreadable metrics snapshot %s", path)
+
+
+def snapshots():
+    own = own_snapshot()
+    if not shared_dir():
+        return [own]
+    dump(own)
+    found = [own]
+    for path in glob.glob(os.path.join(shared_dir(), '*.json')):
+        if path != process_path():
+            snapshot = read_snapshot(path)
+            if snapshot is not None:
+                found.append(snapshot)
+    return found
+
+
+def merge_snapshots(found):
+    views = {}
+    for snapshot in found:
+        for name, view in snapshot['views'].items():
+            merge_view(views.setdefault(name, new_view()), view)
+    slow = sorted((query for snapshot in found for query in snapshot['slow']), key=lambda query: query['time'])
+    return views, slow[-_slow_queries.maxlen:]
+
+
+def retire(pid):
+    directory = shared_dir()
+    if not directory:
+        return
+    paths = glob.glob(os.path.join(directory, f"{socket.gethostname()}-{pid}-*.json"))
+    if not paths:
+        return
+    retired = os.path.join(directory, 'retired.json')
+    if os.path.exists(retired):
+        paths.append(retired)
+    found = [snapshot for snapshot in map(read_snapshot, paths) if snapshot is not None]
+    views, slow = merge_snapshots(found)
+    tmp = f"{retired}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'views': {name: snapshot_view(view) for name, view in views.items()}, 'slow': slow}, f, separators=(',', ':'))
+        os.replace(tmp, retired)
+        for path in paths:
+            if path != retired:
+                os.unlink(path)
+    except OSError:
+        logger.exception("Failed to merge the metrics snapshots of worker %s", pid)
+
+
+def clear_shared():
+    directory = shared_dir()
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.unlink(path)
+
+
+def slow_queries():
+    return merge_snapshots(snapshots())[1]
+
+
+def histogram_lines(metric, view, histogram):
+    lines = []
+    cumulative = 0
+    for bucket, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{view="{view}",le="{bucket}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum}')
+    lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+    return lines
+
+
+def render():
+    histograms = [
+        ('ask_request_duration_seconds', 'duration', 'Wall time per request'),
+        ('ask_db_duration_seconds', 'db_duration', 'Time spent in SQL per request'),
+        ('ask_template_render_seconds', 'render_duration', 'Template render time per request'),
+        ('ask_db_queries', 'queries', 'SQL queries per request'),
+    ]
+    counters = [
+        ('ask_cache_gets_total', 'cache_gets', 'Cache keys read'),
+        ('ask_cache_misses_total', 'cache_misses', 'Cache keys not found'),
+    ]
+    views = sorted(merge_snapshots(snapshots())[0].items())
+
+    lines = ['# HELP ask_requests_total Requests by view and status class', '# TYPE ask_requests_total counter']
+    for name, view in views:
+        for status_class, count in sorted(view['requests'].items()):
+            lines.append(f'ask_requests_total{{view="{name}",status="{status_class}"}} {count}')
+    for metric, field, description in histograms:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+        for name, view in views:
+            lines += histogram_lines(metric, name, view[field])
+    for metric, field, description in counters:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{view="{name}"}} {view[field]}' for name, view in views]
+    return '\n'.join(lines) + '\n'
+
+
+class CacheMetricsMixin:
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        if not _cache_nested.get():
+            count_cache(1, value is self._missing)
+        return default if value is self._missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        token = _cache_nested.set(True)
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            _cache_nested.reset(token)
+        count_cache(len(keys), len(keys) - len(found))
+        return found
+
+
+class InstrumentedPyMemcacheCache(CacheMetricsMixin, PyMemcacheCache):
+    pass
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        state = current.get()
+        if state is None:
+            return self.template.render(context, request)
+        state['render_depth'] += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            state['render_depth'] -= 1
+            if not state['render_depth']:
+                state['render_time'] += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+
+        state = new_state()
+        token = current.set(state)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        record(request, state, response.status_code, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+
+        state = new_state()
+        token = current.set(state)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        record(request, state, response.status_code, time.perf_counter() - started)
+        return response
@@ -0,0 +1,115 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_question_rating(apps, schema_editor):
+    apps.get_model('app', 'Question').objects.filter(rating__isnull=True).update(rating=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params', models.JSONField()),
+                ('phase', models.CharField(max_length=30)),
+                ('position', models.BigIntegerField(default=0)),
+                ('is_done', models.BooleanField(default=False)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+                ('time_update', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.PositiveSmallIntegerField(choices=[(1, 'question'), (2, 'answer')])),
+                ('target_id', models.BigIntegerField()),
+                ('value', models.SmallIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='questions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_question_rating, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='question',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['rating', 'id'], name='app_profile_rating_44d12b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['time_create', 'id'], name='app_questio_time_cr_52420a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['rating', 'id'], name='app_questio_rating_902a48_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['time_update'], name='app_questio_time_up_7aa715_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['questions_count', 'id'], name='app_tag_questio_d6ffe7_idx'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['target_type', 'target_id', 'value'], name='app_reactio_target__b4f3f9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('user', 'target_type', 'target_id'), name='unique_reaction'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+import os
+from django.db import migrations, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+QUESTION, ANSWER = 1, 2
+LEGACY_TABLES = [
+    ('LikeQuestion', 'question_id', QUESTION, 1),
+    ('DislikeQuestion', 'question_id', QUESTION, -1),
+    ('LikeAnswer', 'answer_id', ANSWER, 1),
+    ('DislikeAnswer', 'answer_id', ANSWER, -1),
+]
+
+
+def count_subquery(model, field, **filters):
+    rows = model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field).annotate(total=Count('*'))
+    return Coalesce(Subquery(rows.values('total'), output_field=IntegerField()), Value(0))
+
+
+def move_legacy_reactions(apps, schema_editor):
+    Reaction = apps.get_model('app', 'Reaction')
+    batch_size = int(os.getenv('RECOUNT_BATCH_SIZE', '5000'))
+    for model_name, field, target_type, value in LEGACY_TABLES:
+        model = apps.get_model('app', model_name)
+        while True:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                rows = list(model.objects.order_by('id').values_list('id', 'user_id', field)[:batch_size])
+                if not rows:
+                    break
+                Reaction.objects.bulk_create(
+                    [Reaction(user_id=user_id, target_type=target_type, target_id=target_id, value=value)
+                     for _, user_id, target_id in rows],
+                    ignore_conflicts=True, batch_size=batch_size,
+                )
+                model.objects.filter(id__lte=rows[-1][0]).delete()
+
+
+def recount_counters(apps, schema_editor):
+    Reaction = apps.get_model('app', 'Reaction')
+    Question = apps.get_model('app', 'Question')
+    Answer = apps.get_model('app', 'Answer')
+    Tag = apps.get_model('app', 'Tag')
+    Question.objects.update(
+        likes_count=count_subquery(Reaction, 'target_id', target_type=QUESTION, value=1),
+        dislikes_count=count_subquery(Reaction, 'target_id', target_type=QUESTION, value=-1),
+        answers_count=count_subquery(Answer, 'question'),
+    )
+    Answer.objects.update(
+        likes_count=count_subquery(Reaction, 'target_id', target_type=ANSWER, value=1),
+        dislikes_count=count_subquery(Reaction, 'target_id', target_type=ANSWER, value=-1),
+    )
+    Tag.objects.update(questions_count=count_subquery(Question.tags.through, 'tag'))
+
+
+def forwards(apps, schema_editor):
+    move_legacy_reactions(apps, schema_editor)
+    recount_counters(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0002_counters_reactions_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
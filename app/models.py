@@ -1,7 +1,7 @@
 import os
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models import Count
+from django.db.models import F
 from django.urls import reverse
 
 
@@ -16,56 +16,102 @@ rating = {
 
 class ManagerQuestion(models.Manager):
     def new_questions(self):
-        return self.order_by('-time_create')
+        return self.order_by('-time_create', '-id')
 
     def best_questions(self):
-        return self.order_by('-rating')
+        return self.order_by('-rating', '-id')
+
+    def tagged_questions(self, tag):
+        return self.filter(tags=tag).order_by('-rating', '-id')
+
+    def listing(self, queryset):
+        return queryset.select_related('user__profile')
 
 
 class ManagerAnswer(models.Manager):
     def best_answers(self, question_id):
-        return self.filter(question=question_id).order_by('-rating', '-time_create')
+        return self.filter(question=question_id).select_related('user__profile').order_by('-rating', '-time_create')
 
 
 class ManagerTopObjects(models.Manager):
     def popular_tags(self):
-        return self.get_queryset().annotate(num_questions=Count('question')).order_by('-num_questions')[:20]
+        return self.get_queryset().order_by('-questions_count', 'id')[:20]
 
     def top_users(self):
-        return self.get_queryset().order_by('-rating')[:10]
+        return self.get_queryset().order_by('-rating', 'id')[:10]
+
+
+class CounterMixin:
+    def update_counters(self, **deltas):
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        type(self).objects.filter(pk=self.pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+        self.refresh_from_db(fields=list(deltas))
+
+
+class AbstractRatedObject(CounterMixin, models.Model):
+    likes_count = models.PositiveIntegerField(default=0)
+    dislikes_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def count_likes(self):
+        return self.likes_count
 
+    @property
+    def count_dislikes(self):
+        return self.dislikes_count
+
+    def apply_reactions(self, reactions):
+        deltas = {'rating': 0}
+        for action, delta in reactions.items():
+            deltas[f"{action}s_count"] = delta
+            deltas['rating'] += rating[action] * delta
+        self.update_counters(**deltas)
+        return self.rating
 
-class Question(models.Model):
+
+class Question(AbstractRatedObject):
     title = models.CharField(max_length=200)
     text = models.TextField(max_length=1000)
     time_create = models.DateTimeField(auto_now_add=True)
     time_update = models.DateTimeField(auto_now=True)
     is_published = models.BooleanField(default=True)
-    rating = models.IntegerField(null=True, default=0)
+    rating = models.IntegerField(default=0)
     tags = models.ManyToManyField("Tag", blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='questions')
+    answers_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=1)
     objects = models.Manager()
     question_manager = ManagerQuestion()
 
-    @property
-    def count_likes(self):
-        return self.likequestion_set.count()
-
-    @property
-    def count_dislikes(self):
-        return self.dislikequestion_set.count()
+    class Meta:
+        indexes = [
+            models.Index(fields=['time_create', 'id']),
+            models.Index(fields=['rating', 'id']),
+            models.Index(fields=['time_update']),
+        ]
 
     @property
     def count_comments(self):
-        return self.answer_set.count()
+        return self.answers_count
+
+    def update_counters(self, **deltas):
+        if any(deltas.values()):
+            deltas['version'] = 1
+        super().update_counters(**deltas)
 
     def count_rating(self, save=True):
-        rating_like = rating['like'] * self.count_likes
-        rating_dislike = rating['dislike'] * self.count_dislikes
-        rating_comment = rating['comment'] * self.count_comments
+        reactions = Reaction.objects.filter(target_type=Reaction.QUESTION, target_id=self.id)
+        rating_like = rating['like'] * reactions.filter(value=1).count()
+        rating_dislike = rating['dislike'] * reactions.filter(value=-1).count()
+        rating_comment = rating['comment'] * self.answer_set.count()
         self.rating = rating_like + rating_dislike + rating_comment
         if save:
-            self.save()
+            self.save(update_fields=['rating'])
         return self.rating
 
     def get_absolute_url(self):
@@ -75,7 +121,7 @@ class Question(models.Model):
         return self.title
 
 
-class Answer(models.Model):
+class Answer(AbstractRatedObject):
     text = models.TextField(max_length=1000)
     is_correct = models.BooleanField(default=False)
     time_create = models.DateTimeField(auto_now_add=True)
@@ -87,14 +133,6 @@ class Answer(models.Model):
     objects = models.Manager()
     answer_manager = ManagerAnswer()
 
-    @property
-    def count_likes(self):
-        return self.likeanswer_set.count()
-
-    @property
-    def count_dislikes(self):
-        return self.dislikeanswer_set.count()
-
     @property
     def like_difference(self):
         return self.count_likes - self.count_dislikes
@@ -103,22 +141,29 @@ class Answer(models.Model):
         correct = 0
         if self.is_correct:
             correct = 1
-        self.rating = rating['like'] * self.count_likes + rating['dislike'] * self.count_dislikes + correct * rating[
-            'correct']
+        reactions = Reaction.objects.filter(target_type=Reaction.ANSWER, target_id=self.id)
+        self.rating = rating['like'] * reactions.filter(value=1).count() + rating['dislike'] * reactions.filter(value=-1).count() + \
+            correct * rating['correct']
         if save:
-            self.save()
+            self.save(update_fields=['rating'])
         return self.rating
 
     def __str__(self):
         return self.text
 
 
-class Tag(models.Model):
+class Tag(CounterMixin, models.Model):
     title = models.CharField(max_length=30, unique=True)
+    questions_count = models.PositiveIntegerField(default=0)
 
     objects = models.Manager()
     popular_tags_manager = ManagerTopObjects()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['questions_count', 'id']),
+        ]
+
     @property
     def count_questions(self):
         return self.question_set.count()
@@ -130,7 +175,7 @@ class Tag(models.Model):
         return self.title
 
 
-class Profile(models.Model):
+class Profile(CounterMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, unique=True, related_name='profile')
     name = models.TextField(max_length=150, default=None)
     avatar = models.ImageField(upload_to='avatars/')
@@ -138,6 +183,11 @@ class Profile(models.Model):
     objects = models.Manager()
     top_users_manager = ManagerTopObjects()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['rating', 'id']),
+        ]
+
     @property
     def count_questions(self):
         return self.user.questions.count()
@@ -156,7 +206,7 @@ class Profile(models.Model):
         rating_correct = rating['correct'] * self.count_correct
         self.rating = rating_question + rating_answer + rating_correct
         if save:
-            self.save()
+            self.save(update_fields=['rating'])
         return self.rating
 
     def __str__(self):
@@ -199,3 +249,37 @@ class DislikeQuestion(AbstractReactionQuestion):
 class DislikeAnswer(AbstractReactionAnswer):
     class Meta:
         unique_together = ["user", "answer"]
+
+
+class Reaction(models.Model):
+    QUESTION = 1
+    ANSWER = 2
+    TARGET_TYPES = [(QUESTION, 'question'), (ANSWER, 'answer')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    target_type = models.PositiveSmallIntegerField(choices=TARGET_TYPES)
+    target_id = models.BigIntegerField()
+    value = models.SmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'target_type', 'target_id'], name='unique_reaction'),
+        ]
+        indexes = [
+            models.Index(fields=['target_type', 'target_id', 'value']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.get_target_type_display()} {self.target_id}: {self.value:+d}"
+
+
+class FillCheckpoint(models.Model):
+    params = models.JSONField()
+    phase = models.CharField(max_length=30)
+    position = models.BigIntegerField(default=0)
+    is_done = models.BooleanField(default=False)
+    time_create = models.DateTimeField(auto_now_add=True)
+    time_update = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.phase}:{self.position}"
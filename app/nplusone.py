@@ -0,0 +1,158 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+LISTS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+SPACES = re.compile(r"\s+")
+SKIPPED_FILES = tuple(os.path.join(os.path.dirname(__file__), name) for name in ('nplusone.py', 'metrics.py'))
+
+current = ContextVar('nplusone_detector', default=None)
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def enabled():
+    return os.getenv('NPLUSONE_ENABLED', 'false').lower() in ('true', '1', 't')
+
+
+def strict():
+    return os.getenv('NPLUSONE_STRICT', 'false').lower() in ('true', '1', 't')
+
+
+def threshold():
+    return int(os.getenv('NPLUSONE_THRESHOLD', '5'))
+
+
+def fingerprint(sql):
+    sql = STRINGS.sub('?', sql)
+    sql = NUMBERS.sub('?', sql)
+    sql = LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def project_frame(frame):
+    filename = frame.f_code.co_filename
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in filename
+        and not filename.startswith(SKIPPED_FILES)
+    )
+
+
+def origin():
+    frame = sys._getframe(2)
+    template, code = None, None
+    while frame is not None and not (template and code):
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None and getattr(node, 'origin', None) is not None:
+                template = f"{node.origin.template_name or node.origin.name}:{token.lineno}"
+        if code is None and project_frame(frame):
+            path = os.path.relpath(frame.f_code.co_filename, settings.BASE_DIR)
+            code = f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ' via '.join(part for part in (template, code) if part) or 'unknown'
+
+
+class Detector:
+    def __init__(self, limit=None):
+        self.limit = threshold() if limit is None else limit
+        self.counts = Counter()
+        self.origins = {}
+        self.examples = {}
+
+    def add(self, sql):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        self.origins.setdefault(shape, Counter())[origin()] += 1
+        self.examples.setdefault(shape, sql)
+
+    def problems(self):
+        return [
+            {
+                'count': count,
+                'sql': shape,
+                'example': self.examples[shape],
+                'origins': self.origins[shape].most_common(3),
+            }
+            for shape, count in self.counts.most_common() if count >= self.limit
+        ]
+
+    def __enter__(self):
+        self.token = current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        current.reset(self.token)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    detector = current.get()
+    if detector is not None:
+        detector.add(sql)
+    return execute(sql, params, many, context)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def describe(problem):
+    origins = ', '.join(f"{where} ({count}x)" for where, count in problem['origins'])
+    return f"{problem['count']}x {problem['sql'][:300]} from {origins}"
+
+
+def report(request, detector):
+    problems = detector.problems()
+    for problem in problems:
+        logger.warning("N+1 queries on %s %s: %s", request.method, request.get_full_path(), describe(problem))
+    if problems and strict():
+        raise NPlusOneError(
+            f"{len(problems)} repeated query shape(s) on {request.method} {request.get_full_path()}: "
+            + '; '.join(describe(problem) for problem in problems)
+        )
+
+
+class NPlusOneMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not enabled() or current.get() is not None:
+            return self.get_response(request)
+
+        with Detector() as detector:
+            response = self.get_response(request)
+        report(request, detector)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled() or current.get() is not None:
+            return await self.get_response(request)
+
+        with Detector() as detector:
+            response = await self.get_response(request)
+        report(request, detector)
+        return response
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.urls import Resolver404, resolve
+
+
+CACHED_VIEWS = {'index', 'hot', 'tag', 'question'}
+SURROGATE_HEADER = 'Surrogate-Key'
+
+
+def enabled():
+    return os.getenv('PAGE_CACHE_ENABLED', 'true').lower() in ('true', '1', 't')
+
+
+def version_key(key):
+    return f"surrogate:{key}"
+
+
+def page_key(request):
+    return f"page:{hashlib.md5(f'{request.get_host()}{request.get_full_path()}'.encode()).hexdigest()}"
+
+
+def add_surrogate_keys(response, keys):
+    response[SURROGATE_HEADER] = ' '.join(keys)
+    return response
+
+
+def purge(*keys):
+    cache.set_many({version_key(key): time.time_ns() for key in keys}, None)
+
+
+def purge_questions(*question_ids):
+    purge(*(f"question:{question_id}" for question_id in question_ids))
+
+
+def current_versions(keys):
+    found = cache.get_many([version_key(key) for key in keys])
+    versions = {}
+    for key in keys:
+        version = found.get(version_key(key))
+        if version is None:
+            cache.add(version_key(key), time.time_ns(), None)
+            version = cache.get(version_key(key))
+        versions[key] = version
+    return versions
+
+
+async def acurrent_versions(keys):
+    found = await cache.aget_many([version_key(key) for key in keys])
+    versions = {}
+    for key in keys:
+        version = found.get(version_key(key))
+        if version is None:
+            await cache.aadd(version_key(key), time.time_ns(), None)
+            version = await cache.aget(version_key(key))
+        versions[key] = version
+    return versions
+
+
+def cacheable_request(request):
+    if request.method != 'GET' or settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return False
+    try:
+        return resolve(request.path_info).url_name in CACHED_VIEWS
+    except Resolver404:
+        return False
+
+
+def cacheable_response(response):
+    return (
+        response.status_code == 200 and
+        not response.streaming and
+        not response.cookies and
+        SURROGATE_HEADER in response
+    )
+
+
+def cached_response(request, key):
+    entry = cache.get(key)
+    if entry is None or current_versions(list(entry['versions'])) != entry['versions']:
+        return None
+    headers = dict(entry['headers'])
+    response = get_conditional_response(request, etag=headers.get('ETag'))
+    if response is None:
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers']:
+            response[header] = value
+    response['X-Page-Cache'] = 'HIT'
+    return response
+
+
+def store_response(key, response, started):
+    if not cacheable_response(response):
+        return
+    versions = current_versions(response[SURROGATE_HEADER].split())
+    if any(version is None or version >= started for version in versions.values()):
+        return
+    cache.set(key, {
+        'versions': versions,
+        'status': response.status_code,
+        'content': response.content,
+        'headers': list(response.items()),
+    }, int(os.getenv('PAGE_CACHE_TTL', '60')))
+    response['X-Page-Cache'] = 'MISS'
+
+
+class PageCacheMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not enabled() or not cacheable_request(request):
+            return self.get_response(request)
+
+        key = page_key(request)
+        response = cached_response(request, key)
+        if response is not None:
+            return response
+        started = time.time_ns()
+        response = self.get_response(request)
+        store_response(key, response, started)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled() or not cacheable_request(request):
+            return await self.get_response(request)
+
+        key = page_key(request)
+        response = await sync_to_async(cached_response)(request, key)
+        if response is not None:
+            return response
+        started = time.time_ns()
+        response = await self.get_response(request)
+        await sync_to_async(store_response)(key, response, started)
+        return response
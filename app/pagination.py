@@ -0,0 +1,156 @@
+import base64
+import binascii
+import json
+import os
+import time
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+_estimates = {}
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, keys, has_next, has_previous, count=None, estimated=False):
+        self.object_list = object_list
+        self.keys = keys
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+        self.estimated = estimated
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return encode_cursor('next', key_values(self.object_list[-1], self.keys))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return encode_cursor('prev', key_values(self.object_list[0], self.keys))
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, queryset, keys):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'prev') or len(values) != len(keys) or None in values:
+            return None
+        opts = queryset.model._meta
+        return direction, [opts.get_field(name.lstrip('-')).to_python(value) for name, value in zip(keys, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def key_values(obj, keys):
+    return [getattr(obj, name.lstrip('-')) for name in keys]
+
+
+def seek_filter(keys, values, forward=True):
+    condition = Q()
+    equal = Q()
+    for name, value in zip(keys, values):
+        field = name.lstrip('-')
+        descending = name.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f"{field}__{lookup}": value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+def estimate_count(queryset):
+    if queryset.query.where or connection.vendor != 'mysql':
+        return None
+    table = queryset.model._meta.db_table
+    local = _estimates.get(table)
+    if local is not None and local[0] > time.monotonic():
+        return local[1]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [table]
+        )
+        row = cursor.fetchone()
+    estimate = row[0] if row else None
+    _estimates[table] = (time.monotonic() + float(os.getenv('PAGINATE_ESTIMATE_TTL', '60')), estimate)
+    return estimate
+
+
+class KeysetQuery:
+    def __init__(self, queryset, request, per_page=None, count=None):
+        if per_page is None:
+            per_page = int(os.getenv('PAGINATE_PER_PAGE', '20'))
+        if count is None:
+            count = os.getenv('PAGINATE_COUNT', 'estimate')
+
+        keys = list(queryset.query.order_by)
+        if not keys or keys[-1].lstrip('-') not in ('id', 'pk'):
+            raise ValueError("Keyset pagination needs an ordering that ends with a unique id")
+
+        cursor = None
+        token = request.GET.get('cursor')
+        if token:
+            cursor = decode_cursor(token, queryset, keys)
+
+        page_queryset = queryset
+        forward = cursor is None or cursor[0] == 'next'
+        if cursor is not None:
+            page_queryset = page_queryset.filter(seek_filter(keys, cursor[1], forward))
+        if not forward:
+            page_queryset = page_queryset.reverse()
+
+        self.page_queryset = page_queryset[:per_page + 1]
+        self.keys = keys
+        self.per_page = per_page
+        self.count = count
+        self.forward = forward
+        self.resumed = cursor is not None
+
+    def page(self, object_list, total):
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if self.forward:
+            has_next, has_previous = has_more, self.resumed
+        else:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        return KeysetPage(object_list, self.keys, has_next, has_previous, total, estimated=self.count == 'estimate')
+
+
+def keyset_paginate(queryset, request, per_page=None, count=None):
+    query = KeysetQuery(queryset, request, per_page, count)
+    object_list = list(query.page_queryset)
+    total = None
+    if query.count == 'exact':
+        total = queryset.count()
+    elif query.count == 'estimate':
+        total = estimate_count(queryset)
+    return query.page(object_list, total)
+
+
+async def akeyset_paginate(queryset, request, per_page=None, count=None):
+    query = KeysetQuery(queryset, request, per_page, count)
+    object_list = [obj async for obj in query.page_queryset]
+    total = None
+    if query.count == 'exact':
+        total = await queryset.acount()
+    elif query.count == 'estimate':
+        total = await sync_to_async(estimate_count)(queryset)
+    return query.page(object_list, total)
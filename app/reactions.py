@@ -0,0 +1,88 @@
+from django.db import connection
+from django.db.models import Q
+from app.models import Question, Answer, Reaction
+
+
+TARGET_TYPES = {'question': Reaction.QUESTION, 'answer': Reaction.ANSWER}
+TARGET_MODELS = {Reaction.QUESTION: Question, Reaction.ANSWER: Answer}
+STATE_KINDS = {
+    (Reaction.QUESTION, 1): 'likes_question',
+    (Reaction.QUESTION, -1): 'dislikes_question',
+    (Reaction.ANSWER, 1): 'likes_answer',
+    (Reaction.ANSWER, -1): 'dislikes_answer',
+}
+UNIQUE_FIELDS = ['user', 'target_type', 'target_id']
+
+
+def reaction_rows(user, question_ids, answer_ids):
+    if not user.is_authenticated:
+        return None
+    targets = Q()
+    if question_ids:
+        targets |= Q(target_type=Reaction.QUESTION, target_id__in=list(question_ids))
+    if answer_ids:
+        targets |= Q(target_type=Reaction.ANSWER, target_id__in=list(answer_ids))
+    if not targets:
+        return None
+    return Reaction.objects.filter(targets, user=user).values_list('target_type', 'target_id', 'value')
+
+
+def reaction_state(user, question_ids=(), answer_ids=()):
+    state = {kind: set() for kind in STATE_KINDS.values()}
+    rows = reaction_rows(user, question_ids, answer_ids)
+    if rows is not None:
+        for target_type, target_id, value in rows:
+            state[STATE_KINDS[(target_type, value)]].add(target_id)
+    return state
+
+
+async def areaction_state(user, question_ids=(), answer_ids=()):
+    state = {kind: set() for kind in STATE_KINDS.values()}
+    rows = reaction_rows(user, question_ids, answer_ids)
+    if rows is not None:
+        async for target_type, target_id, value in rows:
+            state[STATE_KINDS[(target_type, value)]].add(target_id)
+    return state
+
+
+def upsert(rows):
+    Reaction.objects.bulk_create(
+        [Reaction(user_id=user_id, target_type=target_type, target_id=target_id, value=value)
+         for user_id, target_type, target_id, value in rows],
+        update_conflicts=True, unique_fields=UNIQUE_FIELDS, update_fields=['value'], batch_size=1000,
+    )
+
+
+def upsert_one(user_id, target_type, target_id, value):
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {Reaction._meta.db_table} (user_id, target_type, target_id, value) VALUES (%s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE value = VALUES(value)",
+                [user_id, target_type, target_id, value],
+            )
+            return -value if cursor.rowcount == 2 else 0
+    lookup = {'user_id': user_id, 'target_type': target_type, 'target_id': target_id}
+    if Reaction.objects.filter(**lookup).update(value=value):
+        return -value
+    Reaction.objects.create(**lookup, value=value)
+    return 0
+
+
+def toggle(user_id, target_type, target_id, value):
+    list(TARGET_MODELS[target_type].objects.select_for_update().filter(pk=target_id).values_list('pk', flat=True))
+    if Reaction.objects.filter(user_id=user_id, target_type=target_type, target_id=target_id, value=value).delete()[0]:
+        return value, 0
+    return upsert_one(user_id, target_type, target_id, value), value
+
+
+def counter_deltas(previous, value):
+    return {
+        'like': (value == 1) - (previous == 1),
+        'dislike': (value == -1) - (previous == -1),
+    }
+
+
+def target_deleted(sender, instance, **kwargs):
+    target_type = Reaction.QUESTION if sender._meta.model_name == 'question' else Reaction.ANSWER
+    Reaction.objects.filter(target_type=target_type, target_id=instance.pk).delete()
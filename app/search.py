@@ -0,0 +1,194 @@
+import os
+import re
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from app.models import Question
+
+
+FULLTEXT_INDEX_NAME = 'question_fulltext'
+
+SUGGEST_WEIGHTS = {
+    'exact_title_match': 30,
+    'exact_text_match': 20,
+    'all_words_title': 25,
+    'all_words_text': 15,
+    'word_distance': 10,
+}
+
+PAGE_WEIGHTS = {
+    'exact_title_match': 3,
+    'exact_text_match': 2,
+    'all_words_match': 1,
+}
+
+
+def index_ready():
+    from app import search_index
+
+    return search_index.index_ready()
+
+
+def search_backend():
+    backend = os.getenv('SEARCH_BACKEND') or 'fulltext'
+    if backend == 'inverted' and not index_ready():
+        backend = 'fulltext'
+    if backend == 'fulltext' and connection.vendor != 'mysql':
+        return 'legacy'
+    return backend
+
+
+def parse_query(query):
+    exact_phrase = query.replace('"', '').strip()
+    words = [re.sub(r'^\W+|\W+$', '', word) for word in exact_phrase.split()]
+    return exact_phrase, [word for word in words if word] or exact_phrase.split()
+
+
+def words_regex(words, gap='.*'):
+    return r'\b' + (r'\b' + gap + r'\b').join(re.escape(word) for word in words) + r'\b'
+
+
+def tier(condition, weight):
+    return Case(When(condition, then=Value(weight)), default=Value(0), output_field=IntegerField())
+
+
+def suggest_annotations(exact_phrase, words):
+    return {
+        'exact_title_match': tier(Q(title__icontains=exact_phrase), SUGGEST_WEIGHTS['exact_title_match']),
+        'exact_text_match': tier(Q(text__icontains=exact_phrase), SUGGEST_WEIGHTS['exact_text_match']),
+        'all_words_title': tier(Q(title__iregex=words_regex(words)), SUGGEST_WEIGHTS['all_words_title']),
+        'all_words_text': tier(Q(text__iregex=words_regex(words)), SUGGEST_WEIGHTS['all_words_text']),
+        'word_distance': tier(Q(text__iregex=words_regex(words, '.{1,20}')), SUGGEST_WEIGHTS['word_distance']),
+    }
+
+
+def page_annotations(exact_phrase, words):
+    return {
+        'exact_title_match': tier(Q(title__icontains=exact_phrase), PAGE_WEIGHTS['exact_title_match']),
+        'exact_text_match': tier(Q(text__icontains=exact_phrase), PAGE_WEIGHTS['exact_text_match']),
+        'all_words_match': tier(Q(title__iregex=words_regex(words)), PAGE_WEIGHTS['all_words_match']),
+    }
+
+
+def with_relevance(queryset, annotations):
+    relevance = None
+    for name in annotations:
+        relevance = F(name) if relevance is None else relevance + F(name)
+    return queryset.annotate(**annotations).annotate(relevance=relevance)
+
+
+def legacy_filter(exact_phrase, words):
+    return (
+        Q(title__icontains=exact_phrase) |
+        Q(text__icontains=exact_phrase) |
+        Q(title__iregex=words_regex(words, '')) |
+        Q(text__iregex=words_regex(words, ''))
+    )
+
+
+def boolean_mode_query(words):
+    min_length = int(os.getenv('SEARCH_FULLTEXT_MIN_TOKEN', '3'))
+    tokens = [re.sub(r'[^\w]', '', word) for word in words]
+    tokens = [token for token in tokens if len(token) >= min_length]
+    if not tokens:
+        return None
+    return ' '.join(f'+{token}*' for token in tokens)
+
+
+def match_expression(boolean_query, output_field):
+    table = connection.ops.quote_name(Question._meta.db_table)
+    columns = ', '.join(f'{table}.{connection.ops.quote_name(column)}' for column in ('title', 'text'))
+    return RawSQL(f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)', [boolean_query], output_field=output_field)
+
+
+def candidates(exact_phrase, words, backend=None):
+    backend = backend or search_backend()
+    if backend == 'fulltext':
+        boolean_query = boolean_mode_query(words)
+        if boolean_query is not None:
+            return Question.objects.filter(match_expression(boolean_query, BooleanField())).annotate(
+                match_score=match_expression(boolean_query, FloatField())
+            ), ['-relevance', '-match_score']
+    return Question.objects.filter(legacy_filter(exact_phrase, words)), ['-relevance']
+
+
+class RankedQuestions:
+    def __init__(self, ranked):
+        existing = set(Question.objects.filter(id__in=[doc_id for doc_id, _ in ranked]).values_list('id', flat=True))
+        self.ranked = [(doc_id, score) for doc_id, score in ranked if doc_id in existing]
+
+    def count(self):
+        return len(self.ranked)
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def __getitem__(self, item):
+        ranked = self.ranked[item] if isinstance(item, slice) else [self.ranked[item]]
+        if not ranked:
+            return Question.objects.none()
+        queryset = Question.objects.filter(id__in=[doc_id for doc_id, _ in ranked]).annotate(
+            relevance=Case(*[When(id=doc_id, then=Value(score)) for doc_id, score in ranked],
+                           output_field=IntegerField()),
+            rank=Case(*[When(id=doc_id, then=Value(number)) for number, (doc_id, _) in enumerate(ranked)],
+                      output_field=IntegerField()),
+        ).order_by('rank')
+        return queryset if isinstance(item, slice) else queryset[0]
+
+
+def index_suggest(query, limit):
+    from app.search_index import get_index
+
+    index = get_index()
+    ranked = index.search(query, limit=limit)
+    questions = Question.objects.in_bulk([doc_id for doc_id, _ in ranked])
+    results = []
+    for doc_id, score in ranked:
+        question = questions.get(doc_id)
+        if question is None:
+            index.remove(doc_id)
+            continue
+        question.relevance = score
+        results.append(question)
+    return results
+
+
+def suggest(query, limit=10, backend=None):
+    backend = backend or search_backend()
+    if backend == 'inverted':
+        return index_suggest(query, limit)
+    exact_phrase, words = parse_query(query)
+    queryset, ordering = candidates(exact_phrase, words, backend)
+    return list(with_relevance(queryset, suggest_annotations(exact_phrase, words)).order_by(*ordering)[:limit])
+
+
+def search_queryset(query, backend=None):
+    backend = backend or search_backend()
+    if backend == 'inverted':
+        from app.search_index import get_index
+
+        ranked = get_index().search(query, limit=int(os.getenv('SEARCH_MAX_RESULTS', '1000')), prefix=False)
+        return RankedQuestions(ranked)
+    exact_phrase, words = parse_query(query)
+    queryset, ordering = candidates(exact_phrase, words, backend)
+    return with_relevance(queryset, page_annotations(exact_phrase, words)).order_by(*ordering, '-rating', '-id')
+
+
+def ensure_fulltext_index(using='default', **kwargs):
+    from django.db import connections
+
+    conn = connections[using]
+    if conn.vendor != 'mysql':
+        return
+    table = Question._meta.db_table
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            [table, FULLTEXT_INDEX_NAME]
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f"ALTER TABLE {conn.ops.quote_name(table)} "
+                f"ADD FULLTEXT INDEX {conn.ops.quote_name(FULLTEXT_INDEX_NAME)} (title, text)"
+            )
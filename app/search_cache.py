@@ -0,0 +1,163 @@
+import hashlib
+import os
+import pickle
+import re
+import time
+from django.core.cache import cache
+from django.urls import reverse
+from app import search
+
+
+GENERATION_KEY = 'search:generation'
+STATS_KEYS = {name: f"search:stats:{name}" for name in ('hits', 'prefix_hits', 'misses')}
+
+
+def count(name):
+    key = STATS_KEYS[name]
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    found = cache.get_many(list(STATS_KEYS.values()))
+    return {name: found.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def normalize(query):
+    return ' '.join(query.replace('"', '').lower().split())
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, int(time.time()), None)
+        value = cache.get(GENERATION_KEY) or int(time.time())
+    return value
+
+
+def bump_generation(*args, **kwargs):
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time()), None)
+
+
+def result_key(current, query):
+    return f"search:{current}:q:{hashlib.md5(query.encode()).hexdigest()}"
+
+
+def candidates_key(current, token):
+    return f"search:{current}:c:{hashlib.md5(token.encode()).hexdigest()}"
+
+
+def excerpt(text):
+    return (text[:100] + '...') if len(text) > 100 else text
+
+
+def serialize(question_id, title, text, score):
+    return {
+        'title': title,
+        'text': excerpt(text),
+        'url': reverse('question', kwargs={'question_id': question_id}),
+        'score': score,
+    }
+
+
+def score(title, text, exact_phrase, words):
+    weights = search.SUGGEST_WEIGHTS
+    phrase = exact_phrase.lower()
+    flags = re.IGNORECASE | re.DOTALL
+    if not (
+        phrase in title.lower() or phrase in text.lower() or
+        re.search(search.words_regex(words, ''), title, flags) or
+        re.search(search.words_regex(words, ''), text, flags)
+    ):
+        return 0
+    all_words = search.words_regex(words)
+    return sum((
+        weights['exact_title_match'] if phrase in title.lower() else 0,
+        weights['exact_text_match'] if phrase in text.lower() else 0,
+        weights['all_words_title'] if re.search(all_words, title, flags) else 0,
+        weights['all_words_text'] if re.search(all_words, text, flags) else 0,
+        weights['word_distance'] if re.search(search.words_regex(words, '.{1,20}'), text, flags) else 0,
+    ))
+
+
+def rank(candidates, query, limit):
+    exact_phrase, words = search.parse_query(query)
+    scored = []
+    for question_id, title, text in candidates:
+        relevance = score(title, text, exact_phrase, words)
+        if relevance:
+            scored.append((relevance, question_id, title, text))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [serialize(question_id, title, text, relevance) for relevance, question_id, title, text in scored[:limit]]
+
+
+def store_candidates(current, token, candidates, ttl):
+    if len(pickle.dumps(candidates, pickle.HIGHEST_PROTOCOL)) <= int(os.getenv('SEARCH_CACHE_MAX_BYTES', '900000')):
+        cache.set(candidates_key(current, token), candidates, ttl)
+
+
+def prefix_candidates(current, token):
+    keys = {candidates_key(current, token[:size]): size for size in range(len(token), 1, -1)}
+    found = cache.get_many(list(keys))
+    if not found:
+        return None
+    size = max(keys[key] for key in found)
+    candidates = found[candidates_key(current, token[:size])]
+    if size == len(token):
+        return candidates
+    needle = token.lower()
+    return [row for row in candidates if needle in row[1].lower() or needle in row[2].lower()]
+
+
+def load_candidates(token, limit):
+    exact_phrase, words = search.parse_query(token)
+    queryset, _ = search.candidates(exact_phrase, words)
+    rows = list(queryset.order_by().values_list('id', 'title', 'text')[:limit + 1])
+    if len(rows) > limit:
+        return None
+    needle = token.lower()
+    return [row for row in rows if needle in row[1].lower() or needle in row[2].lower()]
+
+
+def suggestions(query, limit=10):
+    ttl = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+    candidate_limit = int(os.getenv('SEARCH_CACHE_CANDIDATES', '500'))
+    normalized = normalize(query)
+    current = generation()
+
+    key = result_key(current, normalized)
+    results = cache.get(key)
+    if results is not None:
+        count('hits')
+        return results
+
+    exact_phrase, words = search.parse_query(normalized)
+    token = words[0] if words else ''
+    candidates = None
+    if search.search_backend() != 'inverted' and len(token) >= 2:
+        candidates = prefix_candidates(current, token)
+        if candidates is not None:
+            count('prefix_hits')
+        else:
+            count('misses')
+            candidates = load_candidates(token, candidate_limit)
+        if candidates is not None:
+            store_candidates(current, token, candidates, ttl)
+    else:
+        count('misses')
+
+    if candidates is not None:
+        results = rank(candidates, normalized, limit)
+    else:
+        results = [
+            serialize(question.id, question.title, question.text, question.relevance)
+            for question in search.suggest(normalized, limit)
+        ]
+    cache.set(key, results, ttl)
+    return results
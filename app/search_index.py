@@ -0,0 +1,378 @@
+import array
+import datetime
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from app.search import SUGGEST_WEIGHTS
+
+
+MAGIC = b'ALSI'
+VERSION = 2
+HEADER = struct.Struct('<4sIIQd')
+TITLE, TEXT = 0, 1
+TOKEN_RE = re.compile(r'\w+')
+TOMBSTONE_SEQ_KEY = 'search_index:tombstones'
+
+_ready = {}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def index_path():
+    return os.getenv('SEARCH_INDEX_PATH') or str(settings.BASE_DIR / 'search_index' / 'questions.idx')
+
+
+def index_ready(path=None):
+    path = path or index_path()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return False
+    if _ready.get(path, (None,))[0] != mtime:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        _ready[path] = (mtime, len(header) == HEADER.size and HEADER.unpack(header)[:2] == (MAGIC, VERSION))
+    return _ready[path][1]
+
+
+def tombstone_key(seq):
+    return f"search_index:tombstone:{seq}"
+
+
+def publish_tombstone(doc_id):
+    try:
+        seq = cache.incr(TOMBSTONE_SEQ_KEY)
+    except ValueError:
+        cache.add(TOMBSTONE_SEQ_KEY, 0, None)
+        seq = cache.incr(TOMBSTONE_SEQ_KEY)
+    cache.set(tombstone_key(seq), doc_id, int(os.getenv('SEARCH_TOMBSTONE_TTL', '86400')))
+
+
+class MemorySegment:
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}
+
+    def add(self, doc_id, title, text):
+        self.remove(doc_id)
+        terms = set()
+        for field, value in ((TITLE, title), (TEXT, text)):
+            positions = {}
+            for position, token in enumerate(tokenize(value)):
+                positions.setdefault(token, []).append(position)
+            for token, token_positions in positions.items():
+                self.postings.setdefault(token, {})[(doc_id, field)] = token_positions
+                terms.add(token)
+        self.documents[doc_id] = terms
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            entries = self.postings[token]
+            entries.pop((doc_id, TITLE), None)
+            entries.pop((doc_id, TEXT), None)
+            if not entries:
+                del self.postings[token]
+
+    def terms_with_prefix(self, prefix, limit):
+        return sorted(term for term in self.postings if term.startswith(prefix))[:limit]
+
+    def term_postings(self, term):
+        for (doc_id, field), positions in self.postings.get(term, {}).items():
+            yield doc_id, field, positions
+
+
+class FileSegment:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_terms, postings_length, self.watermark = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a search index of version {VERSION}")
+
+        self.view = view = memoryview(self.mmap)
+        offset = HEADER.size
+        self.term_offsets = view[offset:offset + 4 * (self.num_terms + 1)].cast('I')
+        offset += 4 * (self.num_terms + 1)
+        self.postings_offsets = view[offset:offset + 8 * (self.num_terms + 1)].cast('Q')
+        offset += 8 * (self.num_terms + 1)
+        self.terms_start = offset
+        offset += self.term_offsets[self.num_terms]
+        offset += -offset % 8
+        self.postings = view[offset:offset + 8 * postings_length].cast('Q')
+
+    def term_bytes(self, index):
+        start = self.terms_start + self.term_offsets[index]
+        end = self.terms_start + self.term_offsets[index + 1]
+        return self.mmap[start:end]
+
+    def lower_bound(self, term):
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self.term_bytes(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def terms_with_prefix(self, prefix, limit):
+        prefix = prefix.encode()
+        terms = []
+        index = self.lower_bound(prefix)
+        while index < self.num_terms and len(terms) < limit:
+            term = self.term_bytes(index)
+            if not term.startswith(prefix):
+                break
+            terms.append(term.decode())
+            index += 1
+        return terms
+
+    def term_postings(self, term):
+        term = term.encode()
+        index = self.lower_bound(term)
+        if index >= self.num_terms or self.term_bytes(index) != term:
+            return
+        position, end = self.postings_offsets[index], self.postings_offsets[index + 1]
+        postings = self.postings
+        while position < end:
+            doc_id, field, count = postings[position], postings[position + 1], postings[position + 2]
+            position += 3
+            yield doc_id, field, postings[position:position + count].tolist()
+            position += count
+
+    def close(self):
+        self.term_offsets.release()
+        self.postings_offsets.release()
+        self.postings.release()
+        self.view.release()
+        self.mmap.close()
+
+
+def write_segment(path, documents, watermark):
+    segment = MemorySegment()
+    for doc_id, title, text in documents:
+        segment.add(doc_id, title, text)
+
+    terms = sorted(segment.postings)
+    term_blob = bytearray()
+    term_offsets = array.array('I', [0])
+    postings = array.array('Q')
+    postings_offsets = array.array('Q', [0])
+    for term in terms:
+        term_blob += term.encode()
+        term_offsets.append(len(term_blob))
+        for (doc_id, field), positions in sorted(segment.postings[term].items()):
+            postings.extend((doc_id, field, len(positions)))
+            postings.extend(positions)
+        postings_offsets.append(len(postings))
+    term_blob += b'\0' * (-(HEADER.size + len(term_offsets) * 4 + len(postings_offsets) * 8 + len(term_blob)) % 8)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(terms), len(postings), watermark))
+        f.write(term_offsets.tobytes())
+        f.write(postings_offsets.tobytes())
+        f.write(term_blob)
+        f.write(postings.tobytes())
+    os.replace(tmp_path, path)
+    return len(terms), len(segment.documents)
+
+
+def build_index(path=None, chunk_size=2000):
+    from app.models import Question
+
+    path = path or index_path()
+    watermark = time.time()
+    rows = Question.objects.order_by().values_list('id', 'title', 'text').iterator(chunk_size=chunk_size)
+    return write_segment(path, rows, watermark)
+
+
+def phrase_at(positions, start):
+    return all(start + offset in term_positions for offset, term_positions in enumerate(positions[1:], 1))
+
+
+def in_order(positions, max_gap=None):
+    reachable = positions[0]
+    for term_positions in positions[1:]:
+        if max_gap is None:
+            first = min(reachable)
+            reachable = [min((p for p in term_positions if p > first), default=None)]
+            if reachable[0] is None:
+                return False
+        else:
+            reachable = [p for p in term_positions if any(0 < p - c <= max_gap for c in reachable)]
+            if not reachable:
+                return False
+    return True
+
+
+def score_document(fields):
+    title, text = fields.get(TITLE), fields.get(TEXT)
+    score = 0
+    if title and all(title):
+        title_sets = [set(p) for p in title]
+        if any(phrase_at(title_sets, start) for start in title[0]):
+            score += SUGGEST_WEIGHTS['exact_title_match']
+        if in_order(title):
+            score += SUGGEST_WEIGHTS['all_words_title']
+    if text and all(text):
+        text_sets = [set(p) for p in text]
+        if any(phrase_at(text_sets, start) for start in text[0]):
+            score += SUGGEST_WEIGHTS['exact_text_match']
+        if in_order(text):
+            score += SUGGEST_WEIGHTS['all_words_text']
+        if in_order(text, max_gap=int(os.getenv('SEARCH_PROXIMITY_WINDOW', '4'))):
+            score += SUGGEST_WEIGHTS['word_distance']
+    return score
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.base = None
+        self.base_mtime = None
+        self.overlay = MemorySegment()
+        self.masked = set()
+        self.deleted = set()
+        self.tombstone_seq = 0
+        self.watermark = 0.0
+        self.checked_at = 0.0
+
+    def add(self, doc_id, title, text):
+        with self.lock:
+            self.overlay.add(doc_id, title, text)
+            self.masked.add(doc_id)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self.overlay.remove(doc_id)
+            self.masked.add(doc_id)
+            self.deleted.add(doc_id)
+
+    def sync_tombstones(self):
+        last = cache.get(TOMBSTONE_SEQ_KEY) or 0
+        if last <= self.tombstone_seq:
+            return
+        first = max(self.tombstone_seq + 1, last - int(os.getenv('SEARCH_TOMBSTONE_KEEP', '10000')) + 1)
+        for doc_id in cache.get_many([tombstone_key(seq) for seq in range(first, last + 1)]).values():
+            self.remove(doc_id)
+        self.tombstone_seq = last
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.base_mtime:
+            return
+        if self.base is not None:
+            self.base.close()
+        self.base = FileSegment(self.path)
+        self.base_mtime = mtime
+        self.overlay = MemorySegment()
+        self.masked = set(self.deleted)
+        self.watermark = self.base.watermark
+
+    def refresh(self, force=False):
+        from app.models import Question
+
+        interval = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '1'))
+        with self.lock:
+            if not force and time.monotonic() - self.checked_at < interval:
+                return
+            self.checked_at = time.monotonic()
+            self.load()
+            if self.base is None:
+                return
+            self.sync_tombstones()
+            since = datetime.datetime.fromtimestamp(self.watermark, tz=datetime.timezone.utc)
+            changed = Question.objects.filter(time_update__gte=since).order_by('time_update').values_list(
+                'id', 'title', 'text', 'time_update'
+            )
+            for doc_id, title, text, time_update in changed.iterator():
+                self.add(doc_id, title, text)
+                self.watermark = max(self.watermark, time_update.timestamp())
+
+    def postings(self, terms):
+        matches = {}
+        with self.lock:
+            segments = [(self.overlay, None)]
+            if self.base is not None:
+                segments.append((self.base, self.masked))
+            for segment, masked in segments:
+                for term in terms:
+                    for doc_id, field, positions in segment.term_postings(term):
+                        if masked is not None and doc_id in masked:
+                            continue
+                        matches.setdefault(doc_id, {}).setdefault(field, []).extend(positions)
+        return matches
+
+    def expand_prefix(self, prefix):
+        limit = int(os.getenv('SEARCH_PREFIX_EXPANSIONS', '50'))
+        with self.lock:
+            terms = set(self.overlay.terms_with_prefix(prefix, limit))
+            if self.base is not None:
+                terms.update(self.base.terms_with_prefix(prefix, limit))
+        return sorted(terms)[:limit]
+
+    def search(self, query, limit=10, prefix=True):
+        self.refresh()
+        words = tokenize(query)
+        if not words:
+            return []
+
+        per_word = []
+        for number, word in enumerate(words):
+            terms = self.expand_prefix(word) if prefix and number == len(words) - 1 else [word]
+            matches = self.postings(terms) if terms else {}
+            if not matches:
+                return []
+            per_word.append(matches)
+
+        documents = set(per_word[0])
+        for matches in per_word[1:]:
+            documents &= matches.keys()
+
+        scored = []
+        for doc_id in documents:
+            fields = {}
+            for field in (TITLE, TEXT):
+                positions = [sorted(matches[doc_id].get(field, ())) for matches in per_word]
+                fields[field] = positions
+            score = score_document(fields)
+            if score:
+                scored.append((score, doc_id))
+        scored.sort(reverse=True)
+        return [(doc_id, score) for score, doc_id in (scored if limit is None else scored[:limit])]
+
+
+_index = None
+_index_pid = None
+
+
+def get_index():
+    global _index, _index_pid
+    if _index is None or _index_pid != os.getpid():
+        _index = SearchIndex(index_path())
+        _index_pid = os.getpid()
+    return _index
+
+
+def question_saved(sender, instance, **kwargs):
+    if _index is not None and _index_pid == os.getpid():
+        _index.add(instance.pk, instance.title, instance.text)
+
+
+def question_deleted(sender, instance, **kwargs):
+    publish_tombstone(instance.pk)
+    if _index is not None and _index_pid == os.getpid():
+        _index.remove(instance.pk)
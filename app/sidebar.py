@@ -0,0 +1,19 @@
+from app import leaderboard
+
+
+def popular_tags():
+    return leaderboard.popular_tags()[:leaderboard.popular_tags_size()]
+
+
+def top_users():
+    return leaderboard.top_users()[:leaderboard.top_users_size()]
+
+
+def global_context():
+    return {
+        "menu": {
+            "index": "Main page",
+            "ask": "Ask a question",
+            "hot": "Popular",
+        }
+    }
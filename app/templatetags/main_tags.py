@@ -1,13 +1,13 @@
 from django import template
-from django.core.cache import cache
+from app import sidebar
 
 
 register = template.Library()
 
 @register.simple_tag()
 def get_popular_tags():
-    return cache.get('popular_tags', [])
+    return sidebar.popular_tags()
 
 @register.simple_tag()
 def get_top_users():
-    return cache.get('top_users', [])
+    return sidebar.top_users()
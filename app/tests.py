@@ -1 +1,617 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.conf import settings
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.urls import get_resolver, path, reverse
+from app import async_views, centrifugo, metrics, nplusone, page_cache, reactions, search, search_cache, search_index, votes
+from app.management.commands.check_nplusone import named_patterns
+from app.management.commands.recount_counters import COUNTERS
+from app.models import Question, Answer, Tag, Profile, Reaction
+from app.pagination import encode_cursor, keyset_paginate
+from ask_lokhanev import urls
 
+
+def make_user(username):
+    user = User.objects.create_user(username=username, password='password')
+    Profile.objects.create(user=user, name=username, avatar='avatars/default.png')
+    return user
+
+
+def make_question(user, title='Question title', tags=()):
+    question = Question.objects.create(user=user, title=title, text=f"{title} text")
+    question.tags.add(*tags)
+    return question
+
+
+def seed_site():
+    users = [make_user(f"user_{number}") for number in range(8)]
+    tags = [Tag.objects.create(title=f"tag{number}") for number in range(6)]
+    questions = [
+        make_question(users[number % 8], f"Question number {number}", tags=tags[number % 6:number % 6 + 3])
+        for number in range(25)
+    ]
+    question = questions[0]
+    Answer.objects.bulk_create([Answer(question=question, user=user, text=f"Answer from {user.username}") for user in users])
+    question.update_counters(answers_count=len(users))
+    Reaction.objects.bulk_create(
+        [Reaction(user=user, target_type=Reaction.QUESTION, target_id=question.id, value=1) for user in users]
+    )
+    return question, tags[0], users[0]
+
+
+class CentrifugoStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append((self.path, self.headers['X-API-Key'], body))
+        status, payload = self.server.reply(body['commands'])
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def stale_counters():
+    stale = []
+    for model, expressions in COUNTERS:
+        annotations = {f"actual_{field}": expression for field, expression in expressions.items()}
+        for obj in model.objects.annotate(**annotations):
+            stale += [(model.__name__, obj.pk, field) for field in expressions if getattr(obj, field) != getattr(obj, f"actual_{field}")]
+    return stale
+
+
+class ReactionToggleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.voter = make_user('voter')
+        self.question = make_question(self.author)
+        self.answer = Answer.objects.create(question=self.question, user=self.author, text='Answer text')
+        self.question.update_counters(answers_count=1)
+        self.client.force_login(self.voter)
+
+    def rate(self, action, obj=None):
+        obj = obj or self.question
+        object_type = 'question' if isinstance(obj, Question) else 'answer'
+        response = self.client.post('/rate/', {'id': obj.id, 'action': action, 'type': object_type})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def reactions(self, obj=None):
+        obj = obj or self.question
+        target_type = Reaction.QUESTION if isinstance(obj, Question) else Reaction.ANSWER
+        return list(Reaction.objects.filter(target_type=target_type, target_id=obj.id).values_list('user_id', 'value'))
+
+    def test_like_and_unlike(self):
+        self.assertEqual(self.rate('like')['count_likes'], 1)
+        self.assertEqual(self.reactions(), [(self.voter.id, 1)])
+        self.assertEqual(self.rate('like')['count_likes'], 0)
+        self.assertEqual(self.reactions(), [])
+        self.assertEqual(stale_counters(), [])
+
+    def test_flip_keeps_one_row(self):
+        self.rate('like')
+        result = self.rate('dislike')
+        self.assertEqual((result['count_likes'], result['count_dislikes']), (0, 1))
+        self.assertEqual(self.reactions(), [(self.voter.id, -1)])
+        result = self.rate('like', self.answer)
+        self.assertEqual((result['count_likes'], result['count_dislikes']), (1, 0))
+        self.rate('dislike', self.answer)
+        self.assertEqual(self.reactions(self.answer), [(self.voter.id, -1)])
+        self.assertEqual(stale_counters(), [])
+
+    def test_double_submit_toggles_once_per_request(self):
+        for expected in (1, 0, 1, 0):
+            self.assertEqual(self.rate('like')['count_likes'], expected)
+        self.question.refresh_from_db()
+        self.assertEqual((self.question.likes_count, self.question.rating), (0, 0))
+        self.assertEqual(stale_counters(), [])
+
+    def test_update_counters_reads_back_the_stored_value(self):
+        stale = Question.objects.get(pk=self.question.pk)
+        self.question.update_counters(likes_count=1)
+        stale.update_counters(likes_count=1)
+        self.assertEqual((stale.likes_count, stale.version), (2, 4))
+
+    def test_toggle_writes_once(self):
+        args = (self.voter.id, Reaction.QUESTION, self.question.id)
+        with self.assertNumQueries(3 if connection.vendor == 'mysql' else 4):
+            self.assertEqual(reactions.toggle(*args, 1), (0, 1))
+        with self.assertNumQueries(3):
+            self.assertEqual(reactions.toggle(*args, -1), (1, -1))
+        with self.assertNumQueries(2):
+            self.assertEqual(reactions.toggle(*args, -1), (-1, 0))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentToggleTests(TransactionTestCase):
+    def test_concurrent_double_submit(self):
+        author = make_user('author')
+        voter = make_user('voter')
+        question = make_question(author)
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def click():
+            client = Client()
+            client.force_login(voter)
+            barrier.wait()
+            statuses.append(client.post('/rate/', {'id': question.id, 'action': 'like', 'type': 'question'}).status_code)
+            connection.close()
+
+        threads = [threading.Thread(target=click) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200, 200])
+        question.refresh_from_db()
+        self.assertEqual(question.likes_count, Reaction.objects.filter(target_id=question.id, value=1).count())
+        self.assertEqual(question.likes_count, 0)
+
+
+@mock.patch.object(votes.VoteBuffer, 'start', lambda self: None)
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = self.journal_dir()
+        self.author = make_user('author')
+        self.voter = make_user('voter')
+        self.question = make_question(self.author)
+
+    def journal_dir(self):
+        directory = tempfile.mkdtemp(prefix='votes-')
+        self.addCleanup(shutil.rmtree, directory)
+        return directory
+
+    def buffer(self, directory=None):
+        buffer = votes.VoteBuffer(votes.Journal(directory or self.directory))
+        self.addCleanup(lambda: [f.close() for _, f in [buffer.journal.segment, *buffer.failed_segments]])
+        return buffer
+
+    def vote(self, buffer, action='like'):
+        return buffer.vote(Question.objects.get(pk=self.question.pk), 'question', self.voter, action)
+
+    def reactions(self):
+        return list(Reaction.objects.filter(target_type=Reaction.QUESTION, target_id=self.question.id).values_list('value', flat=True))
+
+    def test_toggle_before_flush(self):
+        buffer = self.buffer()
+        self.assertEqual([self.vote(buffer), self.vote(buffer), self.vote(buffer, 'dislike')], [1, 0, -1])
+        self.assertEqual(self.reactions(), [])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.reactions(), [-1])
+        self.assertEqual(stale_counters(), [])
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(buffer.journal.segment[0])])
+
+    def test_stale_flush_from_another_worker(self):
+        first, second = self.buffer(), self.buffer(self.journal_dir())
+        self.vote(first)
+        self.assertEqual(self.vote(second), 0)
+        second.flush()
+        first.flush()
+        self.assertEqual(self.reactions(), [])
+        self.assertEqual(stale_counters(), [])
+
+    def test_failed_flush_is_retried(self):
+        buffer = self.buffer()
+        self.vote(buffer)
+        with mock.patch.object(votes, 'apply_votes', side_effect=RuntimeError), self.assertLogs('app.votes', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer.failed_segments), 1)
+        self.assertEqual(buffer.unflushed('question', self.question.id), (1, 0))
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.reactions(), [1])
+        self.assertEqual((buffer.failed_segments, len(os.listdir(self.directory))), ([], 1))
+        self.assertEqual(stale_counters(), [])
+
+    def test_replay_orphans(self):
+        other = make_user('other')
+        with open(os.path.join(self.directory, 'crashed-1.jsonl'), 'w', encoding='utf-8') as f:
+            f.write(f'{{"type":"question","id":{self.question.id},"user":{self.voter.id},"value":1,"seq":1,"ts":1}}\n')
+            f.write(f'{{"type":"question","id":{self.question.id},"user":{other.id},"value":-1,"seq":1,"ts":2}}\n')
+            f.write(f'{{"type":"question","id":{self.question.id},"user":{self.voter.id},"value":0,"seq":2,"ts":3}}\n')
+            f.write('{"type":"question","id":')
+        with self.assertLogs('app.votes', 'WARNING'):
+            self.assertEqual(votes.replay_orphans(self.directory), 2)
+        self.assertEqual(self.reactions(), [-1])
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(stale_counters(), [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        for number, value in enumerate([3, 0, 0, -2, 0, 5, 0]):
+            Question.objects.filter(pk=make_question(self.author, f"Question {number}").pk).update(rating=value)
+
+    def walk(self, queryset):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(queryset, RequestFactory().get('/', {'cursor': cursor} if cursor else {}), per_page=2)
+            seen += [question.id for question in page]
+            cursor = page.next_cursor
+            if cursor is None:
+                return seen
+
+    def test_walk_visits_every_question_once(self):
+        queryset = Question.objects.order_by('-rating', '-id')
+        self.assertEqual(self.walk(queryset), list(queryset.values_list('id', flat=True)))
+
+    def test_null_cursor_falls_back_to_first_page(self):
+        response = self.client.get('/hot/', {'cursor': encode_cursor('next', [None, 1])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [question.id for question in response.context['page_obj']],
+            list(Question.objects.order_by('-rating', '-id').values_list('id', flat=True)[:20]),
+        )
+
+    def test_only_estimates_are_marked_approximate(self):
+        with mock.patch.dict(os.environ, {'PAGINATE_COUNT': 'exact'}):
+            page = keyset_paginate(Question.objects.order_by('-rating', '-id'), RequestFactory().get('/'))
+            self.assertEqual((page.count, page.estimated), (7, False))
+            content = self.client.get('/hot/').content.decode()
+        self.assertIn('>7 questions<', content)
+        self.assertNotIn('~7 questions', content)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp(prefix='metrics-')
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.dict(os.environ, {'METRICS_DIR': self.directory, 'METRICS_TOKEN': 'scrape'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, metrics, '_process_pid', None)
+        metrics._process_pid = None
+        make_question(make_user('author'))
+
+    def scrape(self, **headers):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape', **headers)
+
+    def requests_total(self, body, view='hot'):
+        prefix = f'ask_requests_total{{view="{view}",status="2xx"}} '
+        return next((int(line[len(prefix):]) for line in body.splitlines() if line.startswith(prefix)), 0)
+
+    def test_render_sums_other_worker_snapshots(self):
+        before = self.requests_total(self.scrape().content.decode())
+        self.client.get('/hot/')
+        view = metrics.snapshot_view(metrics.new_view())
+        view['requests'] = {'2xx': 5}
+        view['duration']['counts'][0] = view['duration']['count'] = 5
+        with open(os.path.join(self.directory, 'worker-2.json'), 'w', encoding='utf-8') as f:
+            json.dump({'views': {'hot': view}, 'slow': []}, f)
+
+        body = self.scrape().content.decode()
+        self.assertEqual(self.requests_total(body), before + 6)
+        self.assertIn('ask_request_duration_seconds_count{view="hot"}', body)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_retire_merges_exited_worker_snapshots(self):
+        view = metrics.snapshot_view(metrics.new_view())
+        view['requests'] = {'2xx': 2}
+        for index in range(2):
+            with open(os.path.join(self.directory, f"{socket.gethostname()}-4242-{index}.json"), 'w', encoding='utf-8') as f:
+                json.dump({'views': {'hot': view}, 'slow': []}, f)
+            metrics.retire(4242)
+
+        self.assertEqual(os.listdir(self.directory), ['retired.json'])
+        retired = metrics.read_snapshot(os.path.join(self.directory, 'retired.json'))
+        self.assertEqual(retired['views']['hot']['requests'], {'2xx': 4})
+
+    def test_requests_leave_dumping_to_the_background_thread(self):
+        with mock.patch.object(metrics, '_dumper_pid', None), mock.patch.object(metrics, 'start_dumper') as start_dumper, \
+                mock.patch.object(metrics, 'dump') as dump:
+            self.client.get('/hot/')
+        start_dumper.assert_called_once_with()
+        dump.assert_not_called()
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.scrape().status_code, 200)
+        with mock.patch.dict(os.environ, {'METRICS_TOKEN': ''}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+@mock.patch.dict(os.environ, {
+    'NPLUSONE_ENABLED': 'true', 'NPLUSONE_STRICT': 'true', 'PAGE_CACHE_ENABLED': 'false', 'METRICS_DIR': '', 'METRICS_TOKEN': 'scrape',
+})
+class NPlusOneStrictTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.question, cls.tag, cls.user = seed_site()
+
+    def test_named_urls_have_no_repeated_queries(self):
+        kwargs = {'question_id': self.question.id, 'tag_id': self.tag.id}
+        query = {'search_page': {'q': 'question'}, 'search_api': {'q': 'question'}}
+        member = Client()
+        member.force_login(self.user)
+        for pattern in named_patterns(get_resolver().url_patterns):
+            path = reverse(pattern.name, kwargs={name: kwargs[name] for name in pattern.pattern.converters})
+            for client in (Client(), member):
+                cache.clear()
+                with self.subTest(path=path, user=client is member):
+                    try:
+                        response = client.get(path, query.get(pattern.name, {}), HTTP_AUTHORIZATION='Bearer scrape',
+                                              secure=settings.SECURE_SSL_REDIRECT)
+                    except nplusone.NPlusOneError as error:
+                        self.fail(str(error))
+                    self.assertLess(response.status_code, 500)
+
+
+@mock.patch.dict(os.environ, {'PAGE_CACHE_ENABLED': 'false', 'METRICS_DIR': ''})
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.question, cls.tag, cls.user = seed_site()
+
+    def setUp(self):
+        cache.clear()
+        self.member = Client()
+        self.member.force_login(self.user)
+
+    def assertQueries(self, anonymous, member, path, data=None):
+        for client, count in ((self.client, anonymous), (self.member, member)):
+            client.get(path, data or {})
+            with self.assertNumQueries(count):
+                self.assertEqual(client.get(path, data or {}).status_code, 200)
+
+    def test_index(self):
+        self.assertQueries(1, 5, '/')
+
+    def test_hot(self):
+        self.assertQueries(1, 5, '/hot/')
+
+    def test_tag(self):
+        self.assertQueries(2, 6, f"/tag/{self.tag.id}/")
+
+    def test_question(self):
+        self.assertQueries(6, 10, f"/question/{self.question.id}/")
+
+    def test_search(self):
+        self.assertQueries(2, 6, '/search/', {'q': 'question'})
+        self.assertQueries(0, 0, '/search_questions/', {'q': 'question'})
+
+    def test_counts_do_not_grow_with_rows(self):
+        users = [make_user(f"extra_{number}") for number in range(6)]
+        Answer.objects.bulk_create([Answer(question=self.question, user=user, text='Another answer') for user in users])
+        self.question.update_counters(answers_count=len(users))
+        for user in users:
+            make_question(user, f"Extra question from {user.username}", tags=[self.tag])
+        self.test_index()
+        self.test_tag()
+        self.test_question()
+
+
+class AsyncUrlconf:
+    urlpatterns = [
+        path(str(pattern.pattern), getattr(async_views, pattern.callback.__name__), name=pattern.name)
+        if getattr(pattern, 'name', None) in ('index', 'hot', 'tag', 'question', 'search_api') else pattern
+        for pattern in urls.urlpatterns
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrlconf)
+@mock.patch.dict(os.environ, {'PAGE_CACHE_ENABLED': 'false', 'METRICS_DIR': ''})
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.question, cls.tag, cls.user = seed_site()
+
+    def setUp(self):
+        cache.clear()
+
+    def paths(self):
+        return ['/', '/hot/', '/?cursor=' + encode_cursor('next', [str(self.question.time_create), self.question.id]),
+                f"/tag/{self.tag.id}/", f"/question/{self.question.id}/"]
+
+    async def test_pages_match_the_sync_views(self):
+        for path in self.paths():
+            with self.subTest(path=path):
+                response = await self.async_client.get(path)
+                self.assertEqual((response.status_code, response.resolver_match.func.__module__), (200, 'app.async_views'))
+                with override_settings(ROOT_URLCONF=urls):
+                    expected = await sync_to_async(Client().get)(path)
+                if 'question' not in path:
+                    self.assertEqual(response.content, expected.content)
+
+    async def test_member_revalidates_with_etag(self):
+        await self.async_client.aforce_login(self.user)
+        for path in self.paths():
+            with self.subTest(path=path):
+                await self.async_client.get(path)
+                etag = (await self.async_client.get(path))['ETag']
+                self.assertEqual((await self.async_client.get(path, headers={'if-none-match': etag})).status_code, 304)
+
+
+class PublisherTests(SimpleTestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), CentrifugoStub)
+        self.server.received = []
+        self.server.reply = lambda commands: (200, {'replies': [{'publish': {}} for _ in commands]})
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def publisher(self, **options):
+        url = centrifugo.batch_url(f"http://127.0.0.1:{self.server.server_port}/api/publish")
+        publisher = centrifugo.Publisher(url, 'api-key', **options)
+        self.addCleanup(publisher.close)
+        return publisher
+
+    def test_batches_commands(self):
+        publisher = self.publisher(batch_size=3, flush_interval=0.5)
+        for number in range(5):
+            self.assertTrue(publisher.publish('7', {'number': number}))
+        self.assertTrue(publisher.flush())
+
+        self.assertEqual([len(body['commands']) for _, _, body in self.server.received], [3, 2])
+        path, api_key, body = self.server.received[0]
+        self.assertEqual((path, api_key), ('/api/batch', 'api-key'))
+        self.assertEqual(body['commands'][0], {'publish': {'channel': '7', 'data': {'number': 0}}})
+        self.assertEqual(publisher.stats(), dict(
+            queued=5, published=5, failed=0, dropped=0, batches=2, coalesced=0, pending=0,
+        ))
+
+    def test_drops_when_queue_is_full(self):
+        publisher = self.publisher(max_queue=2)
+        with mock.patch.object(publisher, 'start'), self.assertLogs('app.centrifugo', 'WARNING'):
+            results = [publisher.publish('7', {'number': number}) for number in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual((publisher.stats()['dropped'], publisher.stats()['pending']), (1, 2))
+
+    def test_counts_failures(self):
+        publisher = self.publisher(flush_interval=0.2)
+        self.server.reply = lambda commands: (200, {'replies': [{'error': {'code': 102}}, {}]})
+        with self.assertLogs('app.centrifugo', 'WARNING'):
+            publisher.publish('7', {})
+            publisher.publish('8', {})
+            publisher.flush()
+        self.assertEqual((publisher.stats()['published'], publisher.stats()['failed']), (1, 1))
+
+        self.server.reply = lambda commands: (500, {})
+        with self.assertLogs('app.centrifugo', 'WARNING'):
+            publisher.publish('7', {})
+            publisher.flush()
+        self.assertEqual((publisher.stats()['published'], publisher.stats()['failed']), (1, 2))
+
+    def test_async_publisher_batches_commands(self):
+        url = centrifugo.batch_url(f"http://127.0.0.1:{self.server.server_port}/api/publish")
+
+        async def publish():
+            publisher = centrifugo.AsyncPublisher(url, 'api-key', batch_size=3, flush_interval=0.5)
+            for number in range(5):
+                self.assertTrue(await publisher.publish('7', {'number': number}))
+            self.assertTrue(await publisher.flush())
+            await publisher.close()
+            return publisher.stats()
+
+        stats = async_to_sync(publish)()
+        self.assertEqual([len(body['commands']) for _, _, body in self.server.received], [3, 2])
+        self.assertEqual(self.server.received[0][:2], ('/api/batch', 'api-key'))
+        self.assertEqual(stats, dict(queued=5, published=5, failed=0, dropped=0, batches=2, pending=0))
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_user('author')
+        for number in range(3):
+            make_question(author, f"Python question {number}")
+
+    def test_stats_are_shared_through_the_cache(self):
+        search_cache.suggestions('python')
+        search_cache.suggestions('python')
+        self.assertEqual(cache.get(search_cache.STATS_KEYS['hits']), 1)
+        self.assertEqual(search_cache.stats(), {'hits': 1, 'prefix_hits': 0, 'misses': 1})
+
+    def test_oversized_candidate_sets_are_not_cached(self):
+        current = search_cache.generation()
+        with mock.patch.dict(os.environ, {'SEARCH_CACHE_MAX_BYTES': '64'}):
+            self.assertEqual(len(search_cache.suggestions('python')), 3)
+        self.assertIsNone(cache.get(search_cache.candidates_key(current, 'python')))
+        search_cache.suggestions('python question')
+        self.assertEqual(len(cache.get(search_cache.candidates_key(current, 'python'))), 3)
+
+
+class InvertedIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp(prefix='search-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'questions.idx')
+        patcher = mock.patch.dict(os.environ, {'SEARCH_BACKEND': 'inverted', 'SEARCH_INDEX_PATH': self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, search_index, '_index', None)
+        search_index._index = None
+        author = make_user('author')
+        self.first = make_question(author, 'Keyset pagination with MySQL')
+        self.second = make_question(author, 'Pagination of search results')
+
+    def test_missing_index_fails_over_without_building(self):
+        self.assertEqual(search.search_backend(), 'legacy')
+        self.assertEqual(self.client.get('/search/', {'q': 'pagination'}).status_code, 200)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_ranked_questions_indexing(self):
+        search_index.build_index(self.path)
+        self.assertEqual(search.search_backend(), 'inverted')
+        results = search.search_queryset('pagination')
+        self.assertEqual(len(results), 2)
+        self.assertIsInstance(results[0], Question)
+        self.assertEqual([question.id for question in results[0:2]], [results[0].id, results[1].id])
+        self.assertEqual(results[-1].id, results[1].id)
+        self.assertGreater(results[0].relevance, 0)
+
+    def test_big_ids_and_old_formats(self):
+        search_index.write_segment(self.path, [(2 ** 40 + 1, 'Big id', 'text')], 0)
+        self.assertEqual(list(search_index.FileSegment(self.path).term_postings('big')), [(2 ** 40 + 1, 0, [0])])
+        with open(self.path, 'wb') as f:
+            f.write(search_index.HEADER.pack(search_index.MAGIC, 1, 0, 0, 0))
+        self.assertEqual(search.search_backend(), 'legacy')
+
+    def test_deletions_reach_other_processes(self):
+        search_index.build_index(self.path)
+        other = search_index.SearchIndex(self.path)
+        other.refresh(force=True)
+        self.assertEqual(len(other.search('keyset')), 1)
+        self.first.delete()
+        other.refresh(force=True)
+        self.assertEqual(other.search('keyset'), [])
+
+    def test_ranked_questions_skip_missing_rows(self):
+        search_index.build_index(self.path)
+        with mock.patch.object(search_index, 'publish_tombstone'):
+            self.first.delete()
+        results = search.search_queryset('pagination')
+        self.assertEqual((len(results), results[0].id), (1, self.second.id))
+
+
+@mock.patch.dict(os.environ, {'PAGE_CACHE_ENABLED': 'false', 'METRICS_DIR': ''})
+class ListingEtagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_user('author')
+        self.python, self.django = Tag.objects.create(title='python'), Tag.objects.create(title='django')
+        self.first = make_question(author, 'First question', tags=[self.python])
+        self.second = make_question(author, 'Second question', tags=[self.django])
+
+    def etag(self, path):
+        self.client.get(path)
+        return self.client.get(path)['ETag']
+
+    def status(self, path, etag):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_purge_only_invalidates_listings_that_show_the_question(self):
+        python_page, django_page = f"/tag/{self.python.id}/", f"/tag/{self.django.id}/"
+        etags = {path: self.etag(path) for path in ('/', python_page, django_page)}
+        self.assertEqual({path: self.status(path, etag) for path, etag in etags.items()},
+                         {'/': 304, python_page: 304, django_page: 304})
+
+        page_cache.purge_questions(self.first.id)
+        self.assertEqual({path: self.status(path, etag) for path, etag in etags.items()},
+                         {'/': 200, python_page: 200, django_page: 304})
+
+    def test_new_question_invalidates_listings(self):
+        etag = self.etag('/')
+        page_cache.purge('questions')
+        self.assertEqual(self.status('/', etag), 200)
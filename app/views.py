@@ -1,20 +1,23 @@
 import os
-import json
 import time
-from django.db.models import Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 import jwt
-import requests
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import render, get_object_or_404, redirect
 from app.models import *
-from ask_lokhanev.settings import CENTRIFUGO_WS_URL_PUBLISH_DATA, CENTRIFUGO_WS_URL, CENTRIFUGO_API_KEY, \
-    CENTRIFUGO_SECRET_KEY
+from ask_lokhanev.settings import CENTRIFUGO_WS_URL, CENTRIFUGO_SECRET_KEY
 from users.forms import AnswerForm, QuestionForm
-from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
-from .models import Question, Answer, LikeQuestion, DislikeQuestion
-from django.db.models import Value, When, Case, F
+from app.cards import attach_cards
+from app.pagination import keyset_paginate
+from app.reactions import TARGET_TYPES, counter_deltas, reaction_state, toggle
+from app.sidebar import global_context
+from app import centrifugo, etags, leaderboard, metrics, page_cache, search, search_cache, votes
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.views.decorators.http import condition, require_POST
+from .models import Question, Answer, rating
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 
 
 def get_centrifugo_data(user_id):
@@ -31,34 +34,43 @@ def get_centrifugo_data(user_id):
     }
 
 
-def ws_add_answer(answer, question_id):
-    data = json.dumps({
-        "channel": f"{question_id}",
-        "data": {
-            "answer": {
-                "id": f"{answer.id}",
-                "text": f"{answer.text}",
-                "user": f"{answer.user.username}",
-                "avatar": f"{answer.user.profile.avatar.url}",
-                "count_likes": f"{answer.count_likes}",
-                "count_dislikes": f"{answer.count_dislikes}",
-                "is_correct": f"{answer.is_correct}"
-            }
+def answer_payload(answer):
+    return {
+        "answer": {
+            "id": f"{answer.id}",
+            "text": f"{answer.text}",
+            "user": f"{answer.user.username}",
+            "avatar": f"{answer.user.profile.avatar.url}",
+            "count_likes": f"{answer.count_likes}",
+            "count_dislikes": f"{answer.count_dislikes}",
+            "is_correct": f"{answer.is_correct}"
         }
+    }
+
+
+def ws_add_answer(answer, question_id):
+    centrifugo.publish(f"{question_id}", answer_payload(answer))
+
 
+def ws_update_rating(obj, object_type, question_id):
+    centrifugo.publish_coalesced(f"{question_id}", f"{object_type}-{obj.id}", {
+        "rating": {
+            "type": object_type,
+            "id": f"{obj.id}",
+            "count_likes": f"{obj.count_likes}",
+            "count_dislikes": f"{obj.count_dislikes}",
+            "rating": f"{obj.rating}"
+        }
     })
-    headers = {'X-API-Key': f'{CENTRIFUGO_API_KEY}', 'Content-type': 'application/json'}
-    requests.post(f"{CENTRIFUGO_WS_URL_PUBLISH_DATA}", data=data, headers=headers)
 
 
-def global_context():
-    return {
-        "menu": {
-            "index": "Main page",
-            "ask": "Ask a question",
-            "hot": "Popular",
+def ws_toggle_correct(answer):
+    centrifugo.publish_coalesced(f"{answer.question_id}", f"correct-{answer.id}", {
+        "correct": {
+            "id": f"{answer.id}",
+            "is_correct": answer.is_correct
         }
-    }
+    })
 
 
 def custom_404(request, exception):
@@ -82,52 +94,26 @@ def search_questions(request):
     if not query or len(query) < 2:
         return JsonResponse({'results': []})
 
-    words = query.split()
-    exact_phrase = query.replace('"', '')
-
-    questions = Question.objects.annotate(
-        exact_title_match=Case(
-            When(title__icontains=exact_phrase, then=Value(30)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        exact_text_match=Case(
-            When(text__icontains=exact_phrase, then=Value(20)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        all_words_title=Case(
-            When(title__iregex=r'\b' + r'\b.*\b'.join(words) + r'\b', then=Value(25)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        all_words_text=Case(
-            When(text__iregex=r'\b' + r'\b.*\b'.join(words) + r'\b', then=Value(15)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        word_distance=Case(
-            When(text__iregex=r'\b' + r'\b.{1,20}\b'.join(words) + r'\b', then=Value(10)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        relevance=F('exact_title_match') + F('exact_text_match') +
-                  F('all_words_title') + F('all_words_text') + F('word_distance')
-    ).filter(
-        Q(title__icontains=exact_phrase) |
-        Q(text__icontains=exact_phrase) |
-        Q(title__iregex=r'\b' + r'\b'.join(words) + r'\b') |
-        Q(text__iregex=r'\b' + r'\b'.join(words) + r'\b')
-    ).order_by('-relevance')[:10]
-
-    results = [{
-        'title': q.title,
-        'text': (q.text[:100] + '...') if len(q.text) > 100 else q.text,
-        'url': q.get_absolute_url(),
-        'score': q.relevance
-    } for q in questions]
-
-    return JsonResponse({'results': results})
+    return JsonResponse({'results': search_cache.suggestions(query)})
+
+
+@user_passes_test(lambda user: user.is_staff)
+def search_cache_stats(request):
+    return JsonResponse(search_cache.stats())
+
+
+def metrics_view(request):
+    token = os.getenv('METRICS_TOKEN')
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=403)
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@user_passes_test(lambda user: user.is_staff)
+def slow_queries(request):
+    return JsonResponse({'queries': metrics.slow_queries()})
 
 
 def search_page(request):
@@ -139,46 +125,16 @@ def search_page(request):
             'empty_query': True
         })
 
-    exact_phrase = query.replace('"', '')
-    words = exact_phrase.split()
-
-    questions = Question.objects.annotate(
-        exact_title_match=Case(
-            When(title__icontains=exact_phrase, then=Value(1)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        exact_text_match=Case(
-            When(text__icontains=exact_phrase, then=Value(1)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        all_words_match=Case(
-            When(title__iregex=r'\b' + r'\b.*\b'.join(words) + r'\b', then=Value(1)),
-            default=Value(0),
-            output_field=models.IntegerField()
-        ),
-        relevance=F('exact_title_match') * 3 +
-                  F('exact_text_match') * 2 +
-                  F('all_words_match') * 1
-    ).filter(
-        Q(title__icontains=exact_phrase) |
-        Q(text__icontains=exact_phrase) |
-        Q(title__iregex=r'\b' + r'\b'.join(words) + r'\b') |
-        Q(text__iregex=r'\b' + r'\b'.join(words) + r'\b')
-    ).order_by('-relevance', '-rating')
-
-    likes, dislikes = [], []
-    if request.user.is_authenticated:
-        likes = list(LikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        dislikes = list(DislikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
+    questions = search.search_queryset(query)
 
+    page_obj = paginate_questions(questions, request)
+    reactions = reaction_state(request.user, question_ids=[q.id for q in page_obj])
     context = {
         "title": f'Search: {query}',
-        'page_obj': paginate(questions, request),
+        'page_obj': page_obj,
         "questions": questions,
-        "likes": likes,
-        "dislikes": dislikes,
+        "likes": sorted(reactions['likes_question']),
+        "dislikes": sorted(reactions['dislikes_question']),
         "query": query
     }
     context.update(global_context())
@@ -199,96 +155,121 @@ def paginate(objects_list, request, per_page=None):
     return page_obj
 
 
-def index(request):
-    questions = Question.question_manager.new_questions()
-    likes, dislikes = [], []
-    if request.user.is_authenticated:
-        likes = list(LikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        dislikes = list(DislikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
+def paginate_questions(questions, request, per_page=None, keyset=False):
+    if keyset and os.getenv('PAGINATE_MODE', 'keyset') == 'keyset':
+        page_obj = keyset_paginate(Question.question_manager.listing(questions), request, per_page)
+    else:
+        page_obj = paginate(questions, request, per_page)
+        page_obj.object_list = Question.question_manager.listing(page_obj.object_list)
+    page_obj.object_list = attach_cards(page_obj.object_list)
+    return page_obj
+
+
+def listing_keys(page_obj):
+    return ['questions', *(f"question:{question.id}" for question in page_obj)]
+
+
+def listing_response(request, response, page_obj):
+    keys = listing_keys(page_obj)
+    etags.remember_listing(request, keys)
+    return page_cache.add_surrogate_keys(response, keys)
+
+
+def listing_context(title, page_obj, questions, reactions, **extra):
     context = {
-        "title": "Main page",
-        'page_obj': paginate(questions, request),
+        "title": title,
+        'page_obj': page_obj,
         "questions": questions,
-        "likes": likes,
-        "dislikes": dislikes
+        "likes": sorted(reactions['likes_question']),
+        "dislikes": sorted(reactions['dislikes_question']),
+        **extra
     }
     context.update(global_context())
-    return render(request, 'index.html', context=context)
+    return context
 
 
+@condition(etag_func=etags.listing_etag)
+def index(request):
+    questions = Question.question_manager.new_questions()
+    page_obj = paginate_questions(questions, request, keyset=True)
+    reactions = reaction_state(request.user, question_ids=[q.id for q in page_obj])
+    response = render(request, 'index.html', context=listing_context("Main page", page_obj, questions, reactions))
+    return listing_response(request, response, page_obj)
+
+
+@condition(etag_func=etags.listing_etag)
 def hot(request):
     questions = Question.question_manager.best_questions()
-    likes, dislikes = [], []
-    if request.user.is_authenticated:
-        likes = list(LikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        dislikes = list(DislikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-    context = {
-        "tag_name": "Popular",
-        "title": "Popular",
-        'page_obj': paginate(questions, request),
-        "questions": questions,
-        "likes": likes,
-        "dislikes": dislikes
-    }
-    context.update(global_context())
-    return render(request, 'tag.html', context=context)
+    page_obj = paginate_questions(questions, request, keyset=True)
+    reactions = reaction_state(request.user, question_ids=[q.id for q in page_obj])
+    context = listing_context("Popular", page_obj, questions, reactions, tag_name="Popular")
+    response = render(request, 'tag.html', context=context)
+    return listing_response(request, response, page_obj)
 
 
+@condition(etag_func=etags.listing_etag)
 def tag(request, tag_id):
     tag = get_object_or_404(Tag, pk=tag_id)
-    questions = Question.objects.filter(tags=tag).order_by('-rating')
-    likes, dislikes = [], []
-    if request.user.is_authenticated:
-        likes = list(LikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        dislikes = list(DislikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
+    questions = Question.question_manager.tagged_questions(tag)
+    page_obj = paginate_questions(questions, request, keyset=True)
+    reactions = reaction_state(request.user, question_ids=[q.id for q in page_obj])
+    context = listing_context("Search by tag", page_obj, questions, reactions, tag_name=tag.title)
+    response = render(request, 'tag.html', context=context)
+    return listing_response(request, response, page_obj)
+
+
+def create_answer(request, question):
+    form = AnswerForm(request.POST)
+    if not form.is_valid():
+        return form, None
+    new_answer = form.save(commit=False)
+    new_answer.question = question
+    new_answer.user = request.user
+    with transaction.atomic():
+        new_answer.save()
+        question.update_counters(answers_count=1, rating=rating['comment'])
+        request.user.profile.update_counters(rating=rating['comment'])
+    page_cache.purge_questions(question.id)
+    leaderboard.profile_changed(request.user.profile)
+    return form, new_answer
+
+
+def question_page(request, question, form):
+    comments = list(Answer.answer_manager.best_answers(question_id=question.id))
+    reactions = reaction_state(request.user, question_ids=[question.id], answer_ids=[c.id for c in comments])
+    response = render(request, 'question.html', context=question_context(request, question, form, comments, reactions))
+    return page_cache.add_surrogate_keys(response, [f"question:{question.id}"])
+
+
+def question_context(request, question, form, comments, reactions):
     context = {
-        "tag_name": tag.title,
-        "title": "Search by tag",
-        'page_obj': paginate(questions, request),
-        "questions": questions,
-        "likes": likes,
-        "dislikes": dislikes
+        "title": "Question",
+        "question": question,
+        "comments": comments,
+        "form": form,
+        "likes_question": reactions['likes_question'],
+        "dislikes_question": reactions['dislikes_question'],
+        "likes_answer": reactions['likes_answer'],
+        "dislikes_answer": reactions['dislikes_answer'],
+        'centrifugo': get_centrifugo_data(request.user.id)
     }
     context.update(global_context())
-    return render(request, 'tag.html', context=context)
+    return context
 
 
+@condition(etag_func=etags.question_etag)
 def question(request, question_id):
     question = get_object_or_404(Question, pk=question_id)
-    comments = Answer.answer_manager.best_answers(question_id=question_id)
-    likes_question, dislikes_question, likes_answer, dislikes_answer = [], [], [], []
-    if request.user.is_authenticated:
-        likes_question = list(LikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        dislikes_question = list(DislikeQuestion.objects.filter(user=request.user).values_list('question', flat=True))
-        likes_answer = list(LikeAnswer.objects.filter(user=request.user).values_list('answer', flat=True))
-        dislikes_answer = list(DislikeAnswer.objects.filter(user=request.user).values_list('answer', flat=True))
 
     if request.method == "POST":
-        form = AnswerForm(request.POST)
-        if form.is_valid():
-            new_answer = form.save(commit=False)
-            new_answer.question = question
-            new_answer.user = request.user
-            new_answer.save()
-            question.count_rating()
+        form, new_answer = create_answer(request, question)
+        if new_answer is not None:
             ws_add_answer(new_answer, question_id)
             return redirect(question.get_absolute_url() + f"#comment-{new_answer.pk}")
     else:
         form = AnswerForm()
 
-    context = {
-        "title": "Question",
-        "question": question,
-        "comments": comments,
-        "form": form,
-        "likes_question": likes_question,
-        "dislikes_question": dislikes_question,
-        "likes_answer": likes_answer,
-        "dislikes_answer": dislikes_answer,
-        'centrifugo': get_centrifugo_data(request.user.id)
-    }
-    context.update(global_context())
-    return render(request, 'question.html', context=context)
+    return question_page(request, question, form)
 
 
 def ask(request):
@@ -300,11 +281,19 @@ def ask(request):
         if form.is_valid():
             question = form.save(commit=False)
             question.user = request.user
-            question.save()
-            tags = form.cleaned_data['tags']
-            for tag_title in tags:
-                tag_obj, created = Tag.objects.get_or_create(title=tag_title)
-                question.tags.add(tag_obj)
+            with transaction.atomic():
+                question.save()
+                request.user.profile.update_counters(rating=rating['question'])
+                tags = form.cleaned_data['tags']
+                tag_ids = set()
+                for tag_title in tags:
+                    tag_obj, created = Tag.objects.get_or_create(title=tag_title)
+                    question.tags.add(tag_obj)
+                    tag_ids.add(tag_obj.pk)
+                Tag.objects.filter(pk__in=tag_ids).update(questions_count=F('questions_count') + 1)
+            page_cache.purge('questions')
+            leaderboard.tags_changed(tag_ids)
+            leaderboard.profile_changed(request.user.profile)
             return redirect(question.get_absolute_url())
     else:
         form = QuestionForm()
@@ -329,41 +318,28 @@ def rate_object(request):
     if action not in ['like', 'dislike']:
         return JsonResponse({'error': 'Wrong action'}, status=400)
 
-    if object_type == 'question':
-        Model = Question
-        LikeModel = LikeQuestion
-        DislikeModel = DislikeQuestion
-        lookup = {'question_id': object_id, 'user': request.user}
-    else:
-        Model = Answer
-        LikeModel = LikeAnswer
-        DislikeModel = DislikeAnswer
-        lookup = {'answer_id': object_id, 'user': request.user}
+    Model = Question if object_type == 'question' else Answer
 
     try:
         obj = Model.objects.get(pk=object_id)
     except Model.DoesNotExist:
         return JsonResponse({'error': f'{object_type.capitalize()} not found'}, status=404)
 
-    if action == 'like':
-        if LikeModel.objects.filter(**lookup).exists():
-            LikeModel.objects.filter(**lookup).delete()
-        else:
-            LikeModel.objects.create(**lookup)
-            DislikeModel.objects.filter(**lookup).delete()
-    elif action == 'dislike':
-        if DislikeModel.objects.filter(**lookup).exists():
-            DislikeModel.objects.filter(**lookup).delete()
-        else:
-            DislikeModel.objects.create(**lookup)
-            LikeModel.objects.filter(**lookup).delete()
-
-    rating = obj.count_rating()
+    question_id = obj.id if object_type == 'question' else obj.question_id
+    if votes.enabled():
+        votes.get_buffer().vote(obj, object_type, request.user, action)
+    else:
+        with transaction.atomic():
+            previous, value = toggle(request.user.id, TARGET_TYPES[object_type], obj.id, 1 if action == 'like' else -1)
+            obj.apply_reactions(counter_deltas(previous, value))
+        page_cache.purge_questions(question_id)
+        page_cache.purge(etags.reactions_key(request.user.id))
+    ws_update_rating(obj, object_type, question_id)
 
     return JsonResponse({
         'count_likes': obj.count_likes,
         'count_dislikes': obj.count_dislikes,
-        'rating': rating
+        'rating': obj.rating
     })
 
 
@@ -376,17 +352,22 @@ def toggle_correct_answer(request):
 
     try:
         question = Question.objects.get(pk=question_id)
-        answer = Answer.objects.get(pk=answer_id, question=question)
+        answer = Answer.objects.select_related('user__profile').get(pk=answer_id, question=question)
     except (Question.DoesNotExist, Answer.DoesNotExist):
         return JsonResponse({'error': 'Question or answer not found'}, status=404)
 
     if question.user != request.user:
         return JsonResponse({'error': 'Only the author of the question can change the correctness of the answer'}, status=403)
 
-    answer.is_correct = mark
-    answer.save()
-
-    answer.user.profile.count_rating()
-    answer.count_rating()
+    if answer.is_correct != mark:
+        with transaction.atomic():
+            answer.is_correct = mark
+            answer.save(update_fields=['is_correct', 'time_update'])
+            delta = rating['correct'] if mark else -rating['correct']
+            answer.update_counters(rating=delta)
+            answer.user.profile.update_counters(rating=delta)
+        page_cache.purge_questions(question.id)
+        leaderboard.profile_changed(answer.user.profile)
+        ws_toggle_correct(answer)
 
     return JsonResponse({'is_correct': mark})
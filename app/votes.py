@@ -0,0 +1,315 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from django.core.cache import cache
+from django.db import transaction
+from app import etags, page_cache
+from app.models import Question, Answer, Reaction, rating
+from app.reactions import TARGET_TYPES, counter_deltas, reaction_state, upsert
+
+
+logger = logging.getLogger(__name__)
+
+VOTE_MODELS = {'question': Question, 'answer': Answer}
+VALUES = {'like': 1, 'dislike': -1}
+
+
+def enabled():
+    return os.getenv('VOTES_WRITE_BEHIND', 'false').lower() in ('true', '1', 't')
+
+
+def journal_dir():
+    return os.getenv('VOTES_JOURNAL_DIR', '/app/logs/votes')
+
+
+def state_key(object_type, object_id, user_id):
+    return f"vote:{object_type}:{object_id}:{user_id}"
+
+
+def sequence_key(object_type, object_id, user_id):
+    return f"vote-seq:{object_type}:{object_id}:{user_id}"
+
+
+def next_sequence(key, ttl):
+    seq_key = sequence_key(*key)
+    cache.add(seq_key, 0, ttl)
+    try:
+        return cache.incr(seq_key)
+    except ValueError:
+        cache.set(seq_key, 1, ttl)
+        return 1
+
+
+def drop_outdated(votes):
+    latest = cache.get_many([sequence_key(*key) for key in votes])
+    return {
+        key: value for key, (value, seq) in votes.items()
+        if seq >= latest.get(sequence_key(*key), 0)
+    }
+
+
+def lock_segment(path):
+    f = open(path, 'a+', encoding='utf-8')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+class Journal:
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.sequence = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segment = self.open_segment()
+
+    def open_segment(self):
+        self.sequence += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self.sequence}.jsonl")
+        return path, lock_segment(path)
+
+    def append(self, record):
+        f = self.segment[1]
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def rotate(self):
+        segment, self.segment = self.segment, self.open_segment()
+        return segment
+
+    def release(self, segment):
+        path, f = segment
+        os.unlink(path)
+        f.close()
+
+
+def read_segment(f):
+    f.seek(0)
+    records = []
+    for line in f:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning("Skipping a torn vote journal line in %s", f.name)
+    return records
+
+
+def replay_orphans(directory=None):
+    directory = directory or journal_dir()
+    segments = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        f = lock_segment(path)
+        if f is not None:
+            segments.append((path, f))
+    if not segments:
+        return 0
+
+    records = sorted((record for _, f in segments for record in read_segment(f)), key=lambda record: record['ts'])
+    votes = drop_outdated({(record['type'], record['id'], record['user']): (record['value'], record['seq']) for record in records})
+    apply_votes(votes)
+    for path, f in segments:
+        os.unlink(path)
+        f.close()
+    logger.info("Replayed %s votes from %s orphaned journal segment(s)", len(votes), len(segments))
+    return len(votes)
+
+
+def apply_votes(votes):
+    question_ids, user_ids = set(), set()
+    with transaction.atomic():
+        for object_type, Model in VOTE_MODELS.items():
+            target_type = TARGET_TYPES[object_type]
+            wanted = {(object_id, user_id): value for (kind, object_id, user_id), value in votes.items() if kind == object_type}
+            if not wanted:
+                continue
+            object_ids = {object_id for object_id, _ in wanted}
+            users = {user_id for _, user_id in wanted}
+            locked = Model.objects.select_for_update().filter(id__in=object_ids).order_by('id')
+            if object_type == 'question':
+                parents = {object_id: object_id for object_id in locked.values_list('id', flat=True)}
+            else:
+                parents = dict(locked.values_list('id', 'question_id'))
+
+            existing = Reaction.objects.filter(target_type=target_type, target_id__in=object_ids, user_id__in=users)
+            current = {
+                (object_id, user_id): (value, row_id)
+                for row_id, object_id, user_id, value in existing.values_list('id', 'target_id', 'user_id', 'value')
+            }
+
+            removed, upserted, deltas = [], [], {}
+            for (object_id, user_id), value in wanted.items():
+                previous, row_id = current.get((object_id, user_id), (0, None))
+                if object_id not in parents or previous == value:
+                    continue
+                if value:
+                    upserted.append((user_id, target_type, object_id, value))
+                else:
+                    removed.append(row_id)
+                delta = deltas.setdefault(object_id, {'like': 0, 'dislike': 0})
+                for action, change in counter_deltas(previous, value).items():
+                    delta[action] += change
+                question_ids.add(parents[object_id])
+                user_ids.add(user_id)
+
+            if removed:
+                Reaction.objects.filter(id__in=removed).delete()
+            upsert(upserted)
+            for object_id, delta in deltas.items():
+                Model(pk=object_id).apply_reactions(delta)
+
+    if question_ids:
+        page_cache.purge_questions(*question_ids)
+        page_cache.purge(*(etags.reactions_key(user_id) for user_id in user_ids))
+    return len(votes)
+
+
+class VoteBuffer:
+    def __init__(self, journal=None, batch_size=500, flush_interval=1.0, state_ttl=3600):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.pending = {}
+        self.deltas = {}
+        self.inflight = {}
+        self.failed_segments = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='vote-flusher', daemon=True)
+                self.thread.start()
+
+    def current_value(self, obj, object_type, user):
+        key = (object_type, obj.id, user.id)
+        if key in self.pending:
+            return self.pending[key][0]
+        value = cache.get(state_key(*key))
+        if value is not None:
+            return value
+        state = reaction_state(user, **{f"{object_type}_ids": [obj.id]})
+        if obj.id in state[f"likes_{object_type}"]:
+            return 1
+        if obj.id in state[f"dislikes_{object_type}"]:
+            return -1
+        return 0
+
+    def vote(self, obj, object_type, user, action):
+        self.start()
+        previous = self.current_value(obj, object_type, user)
+        with self.lock:
+            key = (object_type, obj.id, user.id)
+            previous = self.pending[key][0] if key in self.pending else previous
+            value = 0 if previous == VALUES[action] else VALUES[action]
+            seq = next_sequence(key, self.state_ttl)
+            record = {'type': object_type, 'id': obj.id, 'user': user.id, 'value': value, 'seq': seq, 'ts': time.time()}
+            if self.journal is not None:
+                self.journal.append(record)
+            self.pending[key] = (value, seq)
+            delta = self.deltas.setdefault((object_type, obj.id), [0, 0])
+            delta[0] += (value == 1) - (previous == 1)
+            delta[1] += (value == -1) - (previous == -1)
+            likes, dislikes = self.unflushed(object_type, obj.id)
+            size = len(self.pending)
+        cache.set(state_key(object_type, obj.id, user.id), value, self.state_ttl)
+        if size >= self.batch_size:
+            self.wake.set()
+
+        obj.likes_count += likes
+        obj.dislikes_count += dislikes
+        obj.rating = (obj.rating or 0) + rating['like'] * likes + rating['dislike'] * dislikes
+        return value
+
+    def unflushed(self, object_type, object_id):
+        pending = self.deltas.get((object_type, object_id), (0, 0))
+        inflight = self.inflight.get((object_type, object_id), (0, 0))
+        return pending[0] + inflight[0], pending[1] + inflight[1]
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, {}
+                self.inflight, self.deltas = self.deltas, {}
+                segment = self.journal.rotate() if self.journal is not None else None
+            try:
+                apply_votes(drop_outdated(batch))
+            except Exception:
+                logger.exception("Failed to flush %s buffered votes, keeping them for the next flush", len(batch))
+                with self.lock:
+                    for key, value in batch.items():
+                        self.pending.setdefault(key, value)
+                    for key, (likes, dislikes) in self.inflight.items():
+                        delta = self.deltas.setdefault(key, [0, 0])
+                        delta[0] += likes
+                        delta[1] += dislikes
+                    self.inflight = {}
+                    if segment is not None:
+                        self.failed_segments.append(segment)
+                return 0
+
+            with self.lock:
+                self.inflight = {}
+                segments, self.failed_segments = self.failed_segments + ([segment] if segment else []), []
+            if self.journal is not None:
+                for released in segments:
+                    self.journal.release(released)
+            return len(batch)
+
+    def run(self):
+        if self.journal is not None:
+            try:
+                replay_orphans(self.journal.directory)
+            except Exception:
+                logger.exception("Failed to replay orphaned vote journals")
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=10)
+        self.flush()
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer, _buffer_pid
+    with _buffer_lock:
+        if _buffer is None or _buffer_pid != os.getpid():
+            directory = journal_dir()
+            _buffer = VoteBuffer(
+                Journal(directory, fsync=os.getenv('VOTES_JOURNAL_FSYNC', 'false').lower() in ('true', '1', 't')) if directory else None,
+                batch_size=int(os.getenv('VOTES_BATCH_SIZE', '500')),
+                flush_interval=float(os.getenv('VOTES_FLUSH_INTERVAL', '1')),
+                state_ttl=int(os.getenv('VOTES_STATE_TTL', '3600')),
+            )
+            _buffer_pid = os.getpid()
+            atexit.register(_buffer.close)
+        return _buffer
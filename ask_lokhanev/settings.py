@@ -28,9 +28,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.MetricsMiddleware',
+    'app.nplusone.NPlusOneMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'app.page_cache.PageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -43,7 +46,7 @@ ROOT_URLCONF = 'ask_lokhanev.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'app.metrics.InstrumentedDjangoTemplates',
         'DIRS': [
             BASE_DIR / "templates",
         ],
@@ -79,7 +82,7 @@ DATABASES = {
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'BACKEND': 'app.metrics.InstrumentedPyMemcacheCache',
         'LOCATION': os.getenv('MEMCACHED_LOCATION'),
     }
 }
@@ -123,6 +126,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = os.getenv('LOGIN_REDIRECT_URL', 'index')
 
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
 CENTRIFUGO_ENABLED = os.getenv('CENTRIFUGO_ENABLED', 'False').lower() in ('true', '1', 't')
 
 CENTRIFUGO_WS_URL = os.getenv('CENTRIFUGO_WS_URL')
@@ -174,12 +179,14 @@ else:
     CSRF_COOKIE_SAMESITE = 'Lax'
     SESSION_COOKIE_SAMESITE = 'Lax'
 
-cron_top_users_interval = os.getenv('CRON_TOP_USERS_INTERVAL', '*/1 * * * *')
-cron_popular_tags_interval = os.getenv('CRON_POPULAR_TAGS_INTERVAL', '*/1 * * * *')
+cron_top_users_interval = os.getenv('CRON_TOP_USERS_INTERVAL', '0 * * * *')
+cron_popular_tags_interval = os.getenv('CRON_POPULAR_TAGS_INTERVAL', '0 * * * *')
+cron_reconcile_ratings_interval = os.getenv('CRON_RECONCILE_RATINGS_INTERVAL', '0 4 * * *')
 
 CRONJOBS = [
     (cron_top_users_interval, 'app.management.cron.top_users.update_top_users'),
-    (cron_popular_tags_interval, 'app.management.cron.popular_tags.update_popular_tags')
+    (cron_popular_tags_interval, 'app.management.cron.popular_tags.update_popular_tags'),
+    (cron_reconcile_ratings_interval, 'app.management.cron.reconcile_ratings.reconcile_ratings')
 ]
 
 if not DEBUG:
@@ -213,5 +220,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'app': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
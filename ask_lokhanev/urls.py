@@ -3,7 +3,7 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.auth.views import LogoutView
 from django.urls import path
-from app import views as views_app
+from app import async_views, views as views_app
 from app.views import custom_404, custom_403
 from users import views as views_users
 
@@ -11,12 +11,14 @@ from users import views as views_users
 handler404 = custom_404
 handler403 = custom_403
 
+read_views = async_views if settings.SERVER_MODE == 'asgi' else views_app
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views_app.index, name="index"),
-    path('hot/', views_app.hot, name="hot"),
-    path('tag/<int:tag_id>/', views_app.tag, name="tag"),
-    path('question/<int:question_id>/', views_app.question, name="question"),
+    path('', read_views.index, name="index"),
+    path('hot/', read_views.hot, name="hot"),
+    path('tag/<int:tag_id>/', read_views.tag, name="tag"),
+    path('question/<int:question_id>/', read_views.question, name="question"),
     path('login/', views_users.LoginUser.as_view(), name="login"),
     path('logout/', LogoutView.as_view(next_page=None), name='logout'),
     path('signup/', views_users.RegisterUser.as_view(), name="signup"),
@@ -25,7 +27,10 @@ urlpatterns = [
     path('rate/', views_app.rate_object, name='rate_object'),
     path('answer/correct/', views_app.toggle_correct_answer, name='toggle_correct_answer'),
     path('search/', views_app.search_page, name='search_page'),
-    path('search_questions/', views_app.search_questions, name='search_api'),
+    path('search_questions/', read_views.search_questions, name='search_api'),
+    path('search_questions/stats/', views_app.search_cache_stats, name='search_cache_stats'),
+    path('metrics', views_app.metrics_view, name='metrics'),
+    path('metrics/slow_sql/', views_app.slow_queries, name='slow_queries'),
 ]
 
 if settings.DEBUG:
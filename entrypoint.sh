@@ -72,16 +72,19 @@ while ! nc -z ${MEMCACHED_HOST:-memcached} ${MEMCACHED_PORT:-11211}; do
     sleep 2
 done
 
-echo "Creating database migrations..."
-python manage.py makemigrations --noinput
-echo "Migrations created"
-
 echo "Database migrations..."
 python manage.py migrate --noinput
 echo "Migrations completed successfully"
 
 echo "Checking if database needs cleaning..."
-if [ "${RESET_DB_ON_START}" = "True" ] || [ "${RESET_DB_ON_START}" = "true" ] || [ "${RESET_DB_ON_START}" = "1" ]; then
+FILL_DB_INTERRUPTED=$(python manage.py shell -c "
+from app.models import FillCheckpoint
+print(int(FillCheckpoint.objects.filter(is_done=False).exists()))
+" 2>/dev/null || echo 0)
+
+if [ "${FILL_DB_INTERRUPTED}" = "1" ]; then
+    echo "Skipping database cleaning: an interrupted fill_db run will be resumed"
+elif [ "${RESET_DB_ON_START}" = "True" ] || [ "${RESET_DB_ON_START}" = "true" ] || [ "${RESET_DB_ON_START}" = "1" ]; then
     echo "Clearing database..."
 
     python manage.py shell -c "
@@ -141,7 +144,7 @@ else:
 if [ "${DEBUG}" = "True" ] || [ "${DEBUG}" = "true" ] || [ "${DEBUG}" = "1" ]; then
   echo "Filling the database with test data..."
   FILL_DB_RATIO=${FILL_DB_RATIO}
-  echo "We use ratio=$FILL_DB_RATIO"
+  echo "We use ratio=$FILL_DB_RATIO${FILL_DB_SCALE:+, scale=$FILL_DB_SCALE}"
   python manage.py fill_db "$FILL_DB_RATIO"
 fi
 
@@ -152,27 +155,15 @@ python manage.py crontab show
 
 echo "Initializing cache (first run)..."
 python manage.py shell -c "
-from django.core.cache import cache
-from app.models import Tag, Profile
-from django.db.models import Count
-import os
-
-cache.delete('popular_tags')
-cache.delete('top_users')
+from app import leaderboard
 
 try:
-    tags_cache_ttl = int(os.getenv('TAGS_CACHE_TTL', '2678400'))
-    tags = list(Tag.objects.annotate(num_questions=Count('question')).order_by('-num_questions')[:20])
-    cache.set('popular_tags', tags, tags_cache_ttl)
-    print(f'Added to cache: {len(tags)} popular tags (TTL: {tags_cache_ttl} сек.)')
+    print(f'Added to cache: {len(leaderboard.rebuild_popular_tags())} popular tags')
 except Exception as e:
     print(f'Error caching tags: {e}')
 
 try:
-    users_cache_ttl = int(os.getenv('USERS_CACHE_TTL', '604800'))
-    users = list(Profile.objects.all().order_by('-rating')[:10])
-    cache.set('top_users', users, users_cache_ttl)
-    print(f'Added to cache: {len(users)} top users (TTL: {users_cache_ttl} сек.)')
+    print(f'Added to cache: {len(leaderboard.rebuild_top_users())} top users')
 except Exception as e:
     print(f'Error caching users: {e}')
 "
@@ -180,5 +171,13 @@ except Exception as e:
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
+if [ "${SEARCH_BACKEND}" = "inverted" ]; then
+  echo "Building search index..."
+  python manage.py build_search_index
+fi
+
+echo "Replaying vote journals..."
+python manage.py flush_votes
+
 echo "Launching Gunicorn..."
-exec gunicorn -c gunicorn/gunicorn.conf.py ask_lokhanev.wsgi:application
\ No newline at end of file
+exec gunicorn -c gunicorn/gunicorn.conf.py
\ No newline at end of file
@@ -1,5 +1,12 @@
 import os
 import multiprocessing
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ask_lokhanev.settings import SERVER_MODE  # noqa: E402
 
 
 bind = f"{os.getenv('GUNICORN_HOST', '0.0.0.0')}:{os.getenv('GUNICORN_PORT', '8000')}"
@@ -17,8 +24,30 @@ loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
 
 reload = os.getenv('GUNICORN_RELOAD', 'false').lower() == 'true'
 
+wsgi_app = 'ask_lokhanev.wsgi:application'
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'ask_lokhanev.asgi:application'
+    worker_class = os.getenv('GUNICORN_ASGI_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+
 if os.getenv('GUNICORN_WORKERS') is None:
     workers = multiprocessing.cpu_count() * 2 + 1
 
 capture_output = True
 enable_stdio_inheritance = True
+
+
+def on_starting(server):
+    from app.metrics import clear_shared
+
+    clear_shared()
+
+
+def child_exit(server, worker):
+    from app.metrics import retire
+
+    retire(worker.pid)
+
+
+def when_ready(server):
+    server.log.info("Server mode: %s (%s)", SERVER_MODE, wsgi_app)
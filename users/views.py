@@ -4,22 +4,11 @@ from django.contrib.auth.views import LoginView
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView
-from app.models import Tag, Profile
+from app.models import Profile
+from app.sidebar import global_context
 from users.forms import LoginUserForm, RegisterUserForm, ProfileUserForm
 
 
-def global_context():
-    return {
-        "popular_tags": Tag.popular_tags_manager.popular_tags(),
-        "top_users": Profile.top_users_manager.top_users(),
-        "menu": {
-            "index": "Main page",
-            "ask": "Ask a question",
-            "hot": "Popular",
-        }
-    }
-
-
 class LoginUser(LoginView):
     form_class = LoginUserForm
     template_name = 'login.html'